@@ -0,0 +1,319 @@
+"""
+Record/replay of LLM and ERC3 API traffic for offline benchmarking
+"""
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Callable, Deque, Dict, List, Optional
+from pydantic import BaseModel
+
+
+# "" (off), "record" or "replay"
+CASSETTE_MODE = os.getenv("AGENT_CASSETTE_MODE", "")
+CASSETTE_DIR = os.getenv("AGENT_CASSETTE_DIR", "cassettes")
+# Replay latency: "recorded" (sleep as long as the original call) or fixed seconds
+CASSETTE_LATENCY = os.getenv("AGENT_CASSETTE_LATENCY", "0")
+
+
+class CassetteMiss(Exception):
+    """Replay was asked for a call that is not on the cassette"""
+
+
+def _encode(obj: Any) -> Dict[str, Any]:
+    if isinstance(obj, BaseModel):
+        # exclude_unset keeps model_dump_json(exclude_unset=True) output identical on replay
+        return {
+            "type": f"{type(obj).__module__}:{type(obj).__qualname__}",
+            "data": obj.model_dump(mode="json", exclude_unset=True),
+        }
+    return {"type": None, "data": obj}
+
+
+def _namespace(data: Any) -> Any:
+    if isinstance(data, dict):
+        return SimpleNamespace(**{k: _namespace(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [_namespace(v) for v in data]
+    return data
+
+
+def _decode(entry: Dict[str, Any]) -> Any:
+    type_name = entry.get("type")
+    if not type_name:
+        return entry["data"]
+    module, name = type_name.split(":", 1)
+    try:
+        cls = getattr(importlib.import_module(module), name)
+        return cls.model_validate(entry["data"])
+    except Exception:
+        # Class no longer importable: attribute access still works
+        return _namespace(entry["data"])
+
+
+def _encode_error(error: Exception) -> Dict[str, Any]:
+    api_error = getattr(error, "api_error", None)
+    if api_error is not None:
+        return {"kind": "api", "error": api_error.error, "detail": getattr(error, "detail", "")}
+    return {"kind": "other", "message": str(error)}
+
+
+def _decode_error(data: Dict[str, Any]) -> Exception:
+    if data["kind"] == "api":
+        from erc3 import ApiException
+        # Rebuilt without calling __init__: the agent only reads these attributes
+        error = ApiException.__new__(ApiException)
+        error.api_error = SimpleNamespace(error=data["error"])
+        error.detail = data["detail"]
+        return error
+    return RuntimeError(data["message"])
+
+
+def _replay_delay(latency: float):
+    if CASSETTE_LATENCY == "recorded":
+        time.sleep(latency)
+    elif float(CASSETTE_LATENCY) > 0:
+        time.sleep(float(CASSETTE_LATENCY))
+
+
+class Cassette:
+    """One JSONL file of recorded calls
+
+    Entries are matched by key; repeated calls with the same key are served
+    in recording order.
+    """
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Deque[Dict[str, Any]]] = {}
+        if mode == "replay":
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], deque()).append(entry)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # A new recording replaces the old one
+            open(path, "w").close()
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        """Next recorded entry for key without consuming it (replay only)"""
+        with self._lock:
+            queue = self._entries.get(key)
+            return queue[0] if queue else None
+
+    def call(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        meta: Optional[Dict[str, Any]] = None,
+        reuse: bool = False,
+    ) -> Any:
+        """
+        Record fn() under key, or replay the recorded result
+
+        Args:
+            key: Call identity
+            fn: The real call (not invoked in replay mode)
+            meta: Extra fields stored with the entry
+            reuse: Replay the first recording every time instead of consuming entries
+        """
+        if self.mode == "replay":
+            with self._lock:
+                queue = self._entries.get(key)
+                if not queue:
+                    raise CassetteMiss(f"{os.path.basename(self.path)}: no recording for {key}")
+                entry = queue[0] if reuse else queue.popleft()
+            _replay_delay(entry["latency"])
+            if "error" in entry:
+                raise _decode_error(entry["error"])
+            return _decode(entry["response"])
+
+        entry: Dict[str, Any] = {"key": key, **(meta or {})}
+        started = time.time()
+        try:
+            result = fn()
+            entry["response"] = _encode(result)
+            return result
+        except Exception as e:
+            entry["error"] = _encode_error(e)
+            raise
+        finally:
+            entry["latency"] = round(time.time() - started, 4)
+            with self._lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, default=str) + "\n")
+
+
+def _request_key(name: str, payload: str = "") -> str:
+    return f"{name}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}" if payload else name
+
+
+class CassetteDevClient:
+    """ERC3 dev client that records to / replays from a per-task cassette
+
+    Wiki pages are shared by all tasks and cached by WikiStore, so which task
+    loads them depends on scheduling. They are kept on the session cassette
+    and replayed to any task.
+    """
+
+    def __init__(self, client, cassette: Cassette, shared: Cassette):
+        """
+        Args:
+            client: Real dev client (None in replay mode)
+            cassette: Cassette of this task
+            shared: Session cassette (wiki calls)
+        """
+        self.client = client
+        self.cassette = cassette
+        self.shared = shared
+
+    def dispatch(self, request: Any) -> Any:
+        name = type(request).__name__
+        key = _request_key(name, request.model_dump_json())
+        return self.cassette.call(key, lambda: self.client.dispatch(request), {"call": name})
+
+    def who_am_i(self):
+        return self.cassette.call("who_am_i", lambda: self.client.who_am_i())
+
+    def list_wiki_pages(self):
+        return self.shared.call("list_wiki_pages", lambda: self.client.list_wiki_pages(), reuse=True)
+
+    def load_wiki_page(self, path: str):
+        return self.shared.call(
+            _request_key("load_wiki_page", path), lambda: self.client.load_wiki_page(path), reuse=True)
+
+
+class CassetteLLMClient:
+    """LLMClient stand-in that records to / replays from a per-task cassette
+
+    LLM calls of one task are sequential, so they are matched by position;
+    a hash of the messages is stored to flag prompts that drifted since the
+    recording.
+    """
+
+    def __init__(self, client, cassette: Cassette, provider: str, model: str):
+        """
+        Args:
+            client: Real LLMClient (None in replay mode)
+            cassette: Cassette of this task
+            provider: Provider name reported in replay mode
+            model: Model name reported in replay mode
+        """
+        self.client = client
+        self.cassette = cassette
+        self.provider = client.get_provider_name() if client else provider
+        self.model = client.get_model_name() if client else model
+        self._calls = 0
+        self.drifted = 0
+
+    def build_messages(self, static_prompt: str, context_prompt: str, user_text: str) -> List[Dict[str, Any]]:
+        from llm_client import LLMClient
+        return LLMClient.build_messages(static_prompt, context_prompt, user_text)
+
+    def parse_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        response_format: type[BaseModel],
+        max_tokens: int = 16384,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ):
+        self._calls += 1
+        digest = hashlib.sha256(json.dumps(messages, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        key = f"llm:{self._calls}"
+
+        def call():
+            parsed, usage = self.client.parse_completion(messages, response_format, max_tokens, on_field)
+            return {"parsed": parsed.model_dump(mode="json"), "usage": usage}
+
+        if self.cassette.mode == "replay":
+            entry = self.cassette.peek(key)
+            if entry and entry.get("messages_sha") != digest:
+                self.drifted += 1
+        result = self.cassette.call(key, call, {"messages_sha": digest, "schema": response_format.__name__})
+        if self.cassette.mode == "replay" and on_field is not None:
+            # Fields arrive all at once, in generation order
+            for name, value in result["parsed"].items():
+                on_field(name, value)
+        return response_format.model_validate(result["parsed"]), result["usage"]
+
+    def get_model_name(self) -> str:
+        return self.model
+
+    def get_provider_name(self) -> str:
+        return self.provider
+
+
+class CassetteCore:
+    """ERC3 core stand-in: session calls go to session.jsonl, tasks to <task_id>.jsonl"""
+
+    def __init__(self, core, directory: str, mode: str):
+        """
+        Args:
+            core: Real ERC3 instance (None in replay mode)
+            directory: Cassette directory
+            mode: "record" or "replay"
+        """
+        self.core = core
+        self.directory = directory
+        self.mode = mode
+        self.session = Cassette(os.path.join(directory, "session.jsonl"), mode)
+        self._tasks: Dict[str, Cassette] = {}
+        self._lock = threading.Lock()
+
+    def task_cassette(self, task_id: str) -> Cassette:
+        with self._lock:
+            if task_id not in self._tasks:
+                self._tasks[task_id] = Cassette(os.path.join(self.directory, f"{task_id}.jsonl"), self.mode)
+            return self._tasks[task_id]
+
+    def start_session(self, **kwargs):
+        return self.session.call("start_session", lambda: self.core.start_session(**kwargs))
+
+    def session_status(self, session_id: str):
+        return self.session.call("session_status", lambda: self.core.session_status(session_id))
+
+    def start_task(self, task):
+        return self.session.call(f"start_task:{task.task_id}", lambda: self.core.start_task(task))
+
+    def complete_task(self, task):
+        return self.session.call(f"complete_task:{task.task_id}", lambda: self.core.complete_task(task))
+
+    def submit_session(self, session_id: str):
+        return self.session.call("submit_session", lambda: self.core.submit_session(session_id))
+
+    def log_llm(self, **kwargs):
+        # Telemetry only: not recorded, not sent on replay
+        if self.core is not None:
+            return self.core.log_llm(**kwargs)
+
+    def get_erc_dev_client(self, task):
+        client = self.core.get_erc_dev_client(task) if self.core is not None else None
+        return CassetteDevClient(client, self.task_cassette(task.task_id), self.session)
+
+
+def open_core(factory: Callable[[], Any]):
+    """Create the ERC3 core, wrapped for recording/replay if AGENT_CASSETTE_MODE is set"""
+    if CASSETTE_MODE == "replay":
+        return CassetteCore(None, CASSETTE_DIR, "replay")
+    core = factory()
+    if CASSETTE_MODE == "record":
+        return CassetteCore(core, CASSETTE_DIR, "record")
+    return core
+
+
+def make_llm_client(api, task_id: str, provider: str, model: str):
+    """Create the task's LLM client, recording/replaying through the core's cassette"""
+    from llm_client import LLMClient
+    from model_cascade import make_cascade_client
+    if not isinstance(api, CassetteCore):
+        return make_cascade_client(LLMClient, provider, model, task_id)
+    client = make_cascade_client(LLMClient, provider, model, task_id) if api.mode == "record" else None
+    return CassetteLLMClient(client, api.task_cassette(task_id), provider, model)
@@ -0,0 +1,137 @@
+"""
+Session checkpoints so an interrupted main.py run can be resumed
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+CHECKPOINT_DIR = os.getenv("AGENT_CHECKPOINT_DIR", "checkpoints")
+
+
+def write_json_atomic(path: str, data: Any):
+    """Write JSON so that a crash leaves either the old or the new file"""
+    tmp = f"{path}.tmp.{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class TaskCheckpoint:
+    """Conversation log and next step of one task, plus whether it was answered
+    and which write, if any, was being sent when the log was saved"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+        """(index of the next step, log) saved by the last run, if any"""
+        data = _read_json(self.path)
+        if not data or "log" not in data:
+            return None
+        return data["step"], data["log"]
+
+    def save(self, step: int, log: List[Dict[str, Any]]):
+        """Persist the log after `step` steps are done"""
+        data = _read_json(self.path) or {}
+        data.update(step=step, log=log)
+        data.pop("pending_write", None)
+        write_json_atomic(self.path, data)
+
+    def mark_write_pending(self, step: int, log: List[Dict[str, Any]], call_id: str):
+        """Persist the log (ending with the step's tool calls) before the write `call_id` is sent
+
+        Until the next save() the write may or may not have reached the API.
+        """
+        data = _read_json(self.path) or {}
+        data.update(step=step, log=log, pending_write=call_id)
+        write_json_atomic(self.path, data)
+
+    def pending_write(self) -> Optional[str]:
+        """Tool call id of a write that a previous run was sending when it stopped"""
+        return (_read_json(self.path) or {}).get("pending_write")
+
+    def mark_responded(self):
+        """Record that the final answer is being sent (call before dispatching it)"""
+        data = _read_json(self.path) or {}
+        data["responded"] = True
+        write_json_atomic(self.path, data)
+
+    def responded(self) -> bool:
+        """True if a previous run sent (or was sending) the final answer"""
+        return bool((_read_json(self.path) or {}).get("responded"))
+
+
+class SessionCheckpoint:
+    """Which tasks of a session are started/completed, plus per-task checkpoints
+
+    Layout of the directory:
+        session.json      {"session_id", "tasks": {task_id: {"status", "score", "logs"}}}
+        <task_id>.json    {"step", "log", "responded", "pending_write"}
+    """
+
+    def __init__(self, directory: str = CHECKPOINT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._path = os.path.join(directory, "session.json")
+        self._data: Dict[str, Any] = _read_json(self._path) or {"session_id": None, "tasks": {}}
+
+    @property
+    def session_id(self) -> Optional[str]:
+        return self._data.get("session_id")
+
+    def start(self, session_id: str):
+        """Begin a new session; the files of the previous one are removed
+
+        session.json is rewritten and only the task files it lists are
+        deleted, so the directory may hold other files.
+        """
+        with self._lock:
+            for task_id in self._data.get("tasks", {}):
+                _remove(self.task(task_id).path)
+            self._data = {"session_id": session_id, "tasks": {}}
+            write_json_atomic(self._path, self._data)
+
+    def status(self, task_id: str) -> Optional[str]:
+        """"started", "completed" or None"""
+        with self._lock:
+            return self._data["tasks"].get(task_id, {}).get("status")
+
+    def result(self, task_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._data["tasks"].get(task_id, {}))
+
+    def _set(self, task_id: str, **fields):
+        with self._lock:
+            self._data["tasks"].setdefault(task_id, {}).update(fields)
+            write_json_atomic(self._path, self._data)
+
+    def mark_started(self, task_id: str):
+        self._set(task_id, status="started")
+
+    def mark_completed(self, task_id: str, score: Optional[float] = None, logs: Optional[str] = None):
+        self._set(task_id, status="completed", score=score, logs=logs)
+        # The conversation is not needed once the task is scored
+        _remove(self.task(task_id).path)
+
+    def task(self, task_id: str) -> TaskCheckpoint:
+        return TaskCheckpoint(os.path.join(self.directory, f"{task_id}.json"))
@@ -0,0 +1,129 @@
+"""
+Token-budgeted compaction of the agent conversation log
+"""
+import json
+from typing import Any, Dict, List, Tuple
+from tokens import estimate_tokens
+
+
+# Keys whose values identify entities worth keeping in a digest
+_ID_KEYS = ("id", "employee", "project", "customer", "lead", "sku", "path", "file")
+# Scalar fields that usually carry the answer
+_KEY_FIELDS = ("name", "status", "outcome", "next_offset", "total", "error")
+
+
+def message_tokens(msg: Dict[str, Any]) -> int:
+    """Estimated tokens of one chat message (content + tool call arguments)"""
+    tokens = estimate_tokens(msg.get("content") or "") + 4
+    for tc in msg.get("tool_calls", []):
+        tokens += estimate_tokens(tc["function"]["arguments"]) + 8
+    return tokens
+
+
+def digest_result(content: str, max_chars: int = 400) -> str:
+    """Condense a tool result to entity IDs, key fields and list sizes"""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        head = content[:max_chars]
+        return f"[earlier result condensed] {head}{'...' if len(content) > max_chars else ''}"
+
+    ids: List[str] = []
+    fields: List[str] = []
+    lists: List[str] = []
+
+    def walk(value: Any, key: str = "", depth: int = 0):
+        if isinstance(value, dict) and isinstance(value.get("rows"), list) and "columns" in value:
+            # Table from result_encoder: walk it as the list of objects it stands for
+            value = [dict(zip(value["columns"], row)) for row in value["rows"] if isinstance(row, list)]
+        if isinstance(value, dict):
+            for k, v in value.items():
+                walk(v, k, depth + 1)
+        elif isinstance(value, list):
+            if key:
+                lists.append(f"{key}: {len(value)} items")
+            for item in value:
+                walk(item, key, depth + 1)
+        elif isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            lowered = key.lower()
+            if lowered in _ID_KEYS or lowered.endswith("_id"):
+                if str(value) not in ids:
+                    ids.append(str(value))
+            elif lowered in _KEY_FIELDS and depth <= 2:
+                fields.append(f"{key}={value}")
+
+    walk(data)
+    parts = []
+    if lists:
+        parts.append("; ".join(lists))
+    if fields:
+        parts.append(", ".join(fields))
+    if ids:
+        parts.append("ids: " + ", ".join(ids))
+    text = " | ".join(parts) or "no entities"
+    if len(text) > max_chars:
+        text = text[:max_chars] + "..."
+    return f"[earlier result condensed] {text}"
+
+
+class ConversationCompactor:
+    """Keeps the prompt sent to the LLM under a token budget
+
+    The head of the log (system prompts + task) and the last `keep_last`
+    exchanges are always sent verbatim. When the log exceeds the budget,
+    older tool results are replaced by short digests, oldest first; if that
+    is not enough, older assistant messages are shortened as well.
+
+    Compacted messages are memoized per original message, so the prompt
+    prefix stays identical from one step to the next (good for prompt
+    caching and incremental conversion in LLMClient).
+    """
+
+    def __init__(self, token_budget: int = 24000, keep_last: int = 3):
+        self.token_budget = token_budget
+        self.keep_last = keep_last
+        # id(original message) -> (original, compacted); original kept alive so ids stay unique
+        self._compacted: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        self.last_original_tokens = 0
+        self.last_compacted_tokens = 0
+
+    def compact(self, log: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return the messages to send for this step (log itself is not modified)"""
+        messages = [self._compacted.get(id(m), (m, m))[1] for m in log]
+        self.last_original_tokens = sum(message_tokens(m) for m in log)
+        total = sum(message_tokens(m) for m in messages)
+
+        # Everything before the first assistant message is the head; each
+        # assistant message starts an exchange, the last keep_last stay verbatim
+        exchange_starts = [i for i, m in enumerate(log) if m["role"] == "assistant"]
+        head = exchange_starts[0] if exchange_starts else len(log)
+        if self.keep_last <= 0:
+            protected_from = len(log)
+        elif len(exchange_starts) > self.keep_last:
+            protected_from = exchange_starts[-self.keep_last]
+        else:
+            protected_from = head
+
+        for role, shrink in (("tool", self._digest_tool), ("assistant", self._shorten_assistant)):
+            for idx in range(head, protected_from):
+                if total <= self.token_budget:
+                    break
+                original = log[idx]
+                if original["role"] != role or id(original) in self._compacted:
+                    continue
+                replacement = shrink(original)
+                total += message_tokens(replacement) - message_tokens(messages[idx])
+                messages[idx] = replacement
+                self._compacted[id(original)] = (original, replacement)
+
+        self.last_compacted_tokens = total
+        return messages
+
+    def _digest_tool(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        return {**msg, "content": digest_result(msg["content"])}
+
+    def _shorten_assistant(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        content = msg.get("content") or ""
+        if len(content) > 200:
+            content = content[:200] + "..."
+        return {**msg, "content": content}
@@ -0,0 +1,143 @@
+"""
+Per-task read-through cache in front of the ERC3 dev client
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+
+# Request name prefixes that only read data and can be memoized
+READ_PREFIXES = ("Req_Get", "Req_List", "Req_Search", "Req_TimeSummary")
+
+# Successful writes invalidate cached reads whose name contains one of these
+INVALIDATES = {
+    "Req_UpdateEmployeeInfo": ("Employee",),
+    "Req_UpdateProjectTeam": ("Project",),
+    "Req_UpdateProjectStatus": ("Project",),
+    "Req_LogTimeEntry": ("TimeEntr", "TimeSummary"),
+    "Req_UpdateTimeEntry": ("TimeEntr", "TimeSummary"),
+    "Req_UpdateWikiPage": ("Wiki",),
+}
+
+
+def is_read_request(request: Any) -> bool:
+    """True for idempotent Get*/List*/Search*/TimeSummary* requests"""
+    return type(request).__name__.startswith(READ_PREFIXES)
+
+
+class CachingDispatcher:
+    """Memoizes read requests for the duration of one task
+
+    Reads are keyed by request type and arguments. Concurrent callers asking
+    for the same read share one in-flight API call. Writes always go to the
+    API and, when they succeed, drop the cached reads of the affected entity
+    family (unknown writes clear everything).
+
+    Reads issued through `prefetch` fill the cache without counting as hits
+    or misses; the first dispatch they serve counts as a prefetch hit.
+    `listeners` are called with (request, result) for every read fetched on
+    behalf of a dispatch (not for prefetches).
+    """
+
+    def __init__(self, client):
+        """
+        Args:
+            client: ERC3 dev client (api.get_erc_dev_client(task))
+        """
+        self.client = client
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], Future] = {}
+        self._who_am_i = None
+        self._prefetched: Set[Tuple[str, str]] = set()
+        self.listeners: List[Callable[[Any, Any], None]] = []
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.prefetches = 0
+        self.prefetch_hits = 0
+
+    def dispatch(self, request: Any) -> Any:
+        """Dispatch a request, serving repeated reads from the cache"""
+        name = type(request).__name__
+        if not is_read_request(request):
+            result = self.client.dispatch(request)
+            self.invalidate(*INVALIDATES.get(name, ("",)))
+            return result
+
+        key = (name, request.model_dump_json())
+        with self._lock:
+            future = self._entries.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._entries[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+                if key in self._prefetched:
+                    self._prefetched.discard(key)
+                    self.prefetch_hits += 1
+
+        if owner:
+            self._fill(key, future, request)
+            if future.exception() is None:
+                for listener in self.listeners:
+                    listener(request, future.result())
+        return future.result()
+
+    def prefetch(self, request: Any) -> bool:
+        """Fetch a read into the cache ahead of use; False if it was already there
+
+        Errors are swallowed (and not cached).
+        """
+        key = (type(request).__name__, request.model_dump_json())
+        with self._lock:
+            if key in self._entries:
+                return False
+            future = Future()
+            self._entries[key] = future
+            self._prefetched.add(key)
+            self.prefetches += 1
+        self._fill(key, future, request)
+        return True
+
+    def _fill(self, key: Tuple[str, str], future: Future, request: Any):
+        try:
+            future.set_result(self.client.dispatch(request))
+        except BaseException as e:
+            # Errors are not cached: the next call retries
+            with self._lock:
+                if self._entries.get(key) is future:
+                    del self._entries[key]
+                self._prefetched.discard(key)
+            future.set_exception(e)
+
+    def who_am_i(self):
+        """Identity of the current task (fetched once)"""
+        if self._who_am_i is None:
+            self._who_am_i = self.client.who_am_i()
+        return self._who_am_i
+
+    def invalidate(self, *families: str):
+        """Drop cached reads whose request name contains any of `families` ("" = all)"""
+        with self._lock:
+            stale = [key for key in self._entries if any(f in key[0] for f in families)]
+            for key in stale:
+                del self._entries[key]
+                self._prefetched.discard(key)
+            self.invalidations += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "prefetches": self.prefetches,
+            "prefetch_hits": self.prefetch_hits,
+        }
+
+    def __getattr__(self, name: str):
+        # Everything else (wiki helpers, get_employee, ...) goes to the client
+        return getattr(self.client, name)
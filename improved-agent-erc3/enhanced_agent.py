@@ -1,9 +1,55 @@
+import asyncio
+import os
+import re
 import time
-from typing import Annotated, List, Union, Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Annotated, Any, Callable, List, Union, Literal, Optional, Tuple, get_args
 from annotated_types import MaxLen, MinLen
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, create_model
 from erc3 import erc3 as dev, ApiException, TaskInfo, ERC3
-from llm_client import LLMClient
+from cassette import make_llm_client
+from checkpoint import TaskCheckpoint
+from compaction import ConversationCompactor
+from dispatch_cache import CachingDispatcher, is_read_request
+from fast_path import FastPathDecision, classify
+from llm_client import AsyncLLMClient
+from model_cascade import make_cascade_client
+from metrics import get_metrics
+from pagination import drain_pages, is_paged_request
+from prefetch import Prefetcher, make_prefetcher
+from result_encoder import Req_ExpandResult, ResultEncoder
+from wiki_index import Req_SearchWikiLocal, get_wiki_index
+from wiki_store import get_wiki_store
+
+# Read-only tools; several of them may run in parallel within one step
+ReadRequest = Union[
+    dev.Req_ListProjects,
+    dev.Req_ListEmployees,
+    dev.Req_ListCustomers,
+    dev.Req_GetCustomer,
+    dev.Req_GetEmployee,
+    dev.Req_GetProject,
+    dev.Req_GetTimeEntry,
+    dev.Req_SearchProjects,
+    dev.Req_SearchEmployees,
+    dev.Req_SearchTimeEntries,
+    dev.Req_SearchCustomers,
+    dev.Req_TimeSummaryByProject,
+    dev.Req_TimeSummaryByEmployee,
+    dev.Req_ListWikiPages,
+    dev.Req_LoadWikiPage,
+    dev.Req_SearchWiki,
+    Req_SearchWikiLocal,
+    Req_ExpandResult,
+]
+
+
+@lru_cache(maxsize=1)
+def _read_request_adapter() -> TypeAdapter:
+    """Validator for streamed read calls, built on first use to keep it out of import time"""
+    return TypeAdapter(ReadRequest)
+
 
 class NextStep(BaseModel):
     thoughts: str = Field(..., description="Your detailed reasoning about the current situation")
@@ -11,6 +57,7 @@ class NextStep(BaseModel):
     current_state: str
     plan_remaining_steps_brief: Annotated[List[str], MinLen(1), MaxLen(5)] = Field(..., description="explain your thoughts on how to accomplish - what steps to execute")
     task_completed: bool
+    fetch_all_pages: bool = Field(..., description="for List*/Search* calls: return all pages at once instead of one page")
     function: Union[
         dev.Req_ProvideAgentResponse,
         dev.Req_ListProjects,
@@ -35,7 +82,83 @@ class NextStep(BaseModel):
         dev.Req_LoadWikiPage,
         dev.Req_SearchWiki,
         dev.Req_UpdateWikiPage,
+        Req_SearchWikiLocal,
+        Req_ExpandResult,
     ] = Field(..., description="execute first remaining step")
+    parallel_reads: Annotated[List[ReadRequest], MaxLen(4)] = Field(..., description="other independent read-only calls to run at the same time as `function` (e.g. several Req_GetEmployee); empty if none")
+
+
+# Send each user only the tools their access level can use: a smaller
+# schema costs fewer prompt tokens and constrains decoding less.
+# Set DYNAMIC_TOOLS=0 to always use the full NextStep.
+DYNAMIC_TOOLS = os.getenv("DYNAMIC_TOOLS", "1") != "0"
+
+WIKI_READ_TOOLS = (dev.Req_ListWikiPages, dev.Req_LoadWikiPage, dev.Req_SearchWiki, Req_SearchWikiLocal,
+                   Req_ExpandResult)
+# Tools returning wiki text, whose strings are not shortened in tool results
+WIKI_TEXT_TOOLS = (dev.Req_LoadWikiPage, Req_SearchWikiLocal)
+
+# Tools removed per access level (guests get wiki reads and the final response only)
+ACCESS_LEVEL_EXCLUDES = {
+    "member": (dev.Req_UpdateEmployeeInfo, dev.Req_UpdateWikiPage),
+    "executive": (),
+}
+
+# Titles that may change employee records or the wiki; anything that matches
+# keeps the full tool set (erring towards more tools is the safe side)
+_EXECUTIVE_TITLES = re.compile(
+    r"\b(CEO|CTO|CFO|COO|CIO|chief|executive|founder|owner|president|VP|vice president|director|"
+    r"head of|managing|partner|leadership|board|HR|human resources)\b",
+    re.IGNORECASE,
+)
+# Fields of the employee record that hold the job title; nothing else is matched
+_TITLE_FIELDS = ("title", "job_title", "position", "role")
+
+
+def employee_title(employee: BaseModel) -> Optional[str]:
+    """Job title from a Req_GetEmployee response (or the employee itself), if it has one"""
+    data = employee.model_dump()
+    if isinstance(data.get("employee"), dict):
+        data = data["employee"]
+    for field in _TITLE_FIELDS:
+        value = data.get(field)
+        if isinstance(value, str) and value.strip():
+            return value
+    return None
+
+
+def access_level(about: Any, employee: Optional[BaseModel]) -> str:
+    """"guest", "member" or "executive" from who_am_i and the employee's title"""
+    if getattr(about, "is_public", False) and not getattr(about, "current_user", None):
+        return "guest"
+    title = employee_title(employee) if employee is not None else None
+    if title is None:
+        # Role unknown: don't take tools away
+        return "executive"
+    return "executive" if _EXECUTIVE_TITLES.search(title) else "member"
+
+
+@lru_cache(maxsize=None)
+def next_step_model(level: str) -> type[NextStep]:
+    """NextStep restricted to the tools of an access level (built once per level)"""
+    if not DYNAMIC_TOOLS or level not in ("guest", "member"):
+        return NextStep
+    if level == "guest":
+        functions = (dev.Req_ProvideAgentResponse,) + WIKI_READ_TOOLS
+        reads = WIKI_READ_TOOLS
+    else:
+        excluded = ACCESS_LEVEL_EXCLUDES[level]
+        functions = tuple(t for t in get_args(NextStep.model_fields["function"].annotation) if t not in excluded)
+        reads = get_args(ReadRequest)
+    return create_model(
+        f"NextStep{level.title()}",
+        __base__=NextStep,
+        function=(Union[functions], Field(..., description=NextStep.model_fields["function"].description)),
+        parallel_reads=(
+            Annotated[List[Union[reads]], MaxLen(4)],
+            Field(..., description=NextStep.model_fields["parallel_reads"].description),
+        ),
+    )
 
 
 CLI_RED = "\x1B[31m"
@@ -44,43 +167,25 @@ CLI_BLUE = "\x1B[34m"
 CLI_YELLOW = "\x1B[33m"
 CLI_CLR = "\x1B[0m"
 
-def run_agent(model: str, api: ERC3, task: TaskInfo, llm_provider: str = "auto"):
-    """Enhanced agent with Wiki support, better security, and error handling
-    
-    Args:
-        model: Model name (e.g., "gpt-4o", "gemini-2.0-flash-exp")
-        api: ERC3 API instance
-        task: Task information
-        llm_provider: "openai", "google", or "auto" (default: auto-detect)
-    """
-    
-    # Initialize LLM client
-    llm_client = LLMClient(provider=llm_provider, model=model)
-    print(f"{CLI_BLUE}Using LLM: {llm_client.get_provider_name()} / {llm_client.get_model_name()}{CLI_CLR}")
-    
-    store_api = api.get_erc_dev_client(task)
-    about = store_api.who_am_i()
-    
-    # Load wiki pages to understand company rules and context
-    wiki_content = {}
-    try:
-        wiki_list = store_api.list_wiki_pages()
-        print(f"{CLI_YELLOW}Loading Wiki pages...{CLI_CLR}")
-        
-        # Load important pages, especially rulebook
-        for path in wiki_list.paths:
-            try:
-                page = store_api.load_wiki_page(path)
-                wiki_content[path] = page.content
-                if 'rulebook' in path.lower() or 'rule' in path.lower():
-                    print(f"{CLI_YELLOW}Found rulebook: {path}{CLI_CLR}")
-            except Exception as e:
-                print(f"{CLI_RED}Could not load {path}: {e}{CLI_CLR}")
-    except Exception as e:
-        print(f"{CLI_RED}Could not load wiki: {e}{CLI_CLR}")
+# Wiki context included in the system prompt (rulebook is always included)
+WIKI_TOKEN_BUDGET = int(os.getenv("WIKI_TOKEN_BUDGET", "6000"))
+WIKI_TOP_K = int(os.getenv("WIKI_TOP_K", "8"))
 
-    # Build comprehensive system prompt with wiki knowledge
-    system_prompt = f"""
+# Conversation sent to the LLM is compacted above this many (estimated) tokens;
+# the last CONTEXT_KEEP_LAST exchanges are always sent verbatim
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "24000"))
+CONTEXT_KEEP_LAST = int(os.getenv("CONTEXT_KEEP_LAST", "3"))
+
+# Cap on items merged when the agent asks for all pages of a List*/Search* call
+PAGINATION_MAX_ITEMS = int(os.getenv("PAGINATION_MAX_ITEMS", "500"))
+
+# Start API reads as soon as they are generated, while the LLM is still
+# streaming the rest of the step (set EARLY_DISPATCH=0 to disable)
+EARLY_DISPATCH = os.getenv("EARLY_DISPATCH", "1") != "0"
+
+# Static part of the system prompt; keep it free of per-task data so that it
+# stays a byte-stable, cacheable prefix
+SYSTEM_RULES = """
 You are a business assistant helping customers of Aetherion Analytics GmbH.
 
 CRITICAL SECURITY RULES - ENFORCE STRICTLY:
@@ -109,8 +214,22 @@ CRITICAL SECURITY RULES - ENFORCE STRICTLY:
    - ALWAYS check wiki for company rules, especially rulebook.md
    - Follow company policies and guidelines
    - Use wiki context to understand company culture and processes
+   - Only the wiki sections most relevant to the request are included in the
+     task context; use Req_SearchWikiLocal to look up anything else (instant, served locally)
    - If feature not in API, use none_unsupported outcome
 
+4a. PAGINATION:
+   - Set fetch_all_pages=true on List*/Search* calls when you need every match;
+     all pages are returned in one result instead of one page per step
+   - Lists of objects in results are shown as {"columns": [...], "rows": [[...], ...]}
+   - Long texts and oversized results are shortened; call Req_ExpandResult with the
+     handle given there to read the rest (instant, served locally)
+
+4b. PARALLEL READS:
+   - Put other independent read-only calls into parallel_reads (up to 4), e.g. fetching
+     several employees or projects at once; they run concurrently with `function`
+   - Writes (Update*, LogTimeEntry) and the final response only go into `function`
+
 5. ERROR HANDLING:
    - If API returns error, use error_internal outcome
    - If system is broken, acknowledge and report with error_internal
@@ -133,122 +252,621 @@ CRITICAL SECURITY RULES - ENFORCE STRICTLY:
    - outcome: use EXACTLY one of the 6 values above
    - message: clear, helpful explanation
    - links: ALL relevant entities (employee, customer, project, wiki, location)
-
-# Current user context:
-{about.model_dump_json()}
 """
 
+
+def is_read_tool(function: BaseModel) -> bool:
+    """True for tool calls that only read data and may run concurrently"""
+    return isinstance(function, (Req_SearchWikiLocal, Req_ExpandResult)) or is_read_request(function)
+
+
+def decode_streamed_read(raw) -> Optional[BaseModel]:
+    """API read request from a streamed `function`/`parallel_reads` item, else None"""
+    try:
+        request = _read_request_adapter().validate_python(raw)
+    except ValidationError:
+        return None
+    return request if is_read_request(request) else None
+
+
+def is_streamed_response(raw) -> bool:
+    """True if a streamed `function` is the final Req_ProvideAgentResponse"""
+    try:
+        dev.Req_ProvideAgentResponse.model_validate(raw)
+    except ValidationError:
+        return False
+    return True
+
+
+def open_task(api: ERC3, task: TaskInfo) -> Tuple[CachingDispatcher, Any, Optional[FastPathDecision]]:
+    """Dispatcher and identity of a task, plus a decision if no LLM is needed
+
+    Returns:
+        (dispatcher for the task, who_am_i response, fast-path decision or None)
+    """
+    # Repeated reads within the task are served from the cache
+    store_api = CachingDispatcher(api.get_erc_dev_client(task))
+    about = store_api.who_am_i()
+    return store_api, about, classify(about, task.task_text)
+
+
+def answer_fast_path(store_api: CachingDispatcher, decision: FastPathDecision):
+    """Respond to a task decided by the fast path (no wiki, no LLM)"""
+    print(f"{CLI_BLUE}Fast path:{CLI_CLR} {decision.reason}")
+    store_api.dispatch(dev.Req_ProvideAgentResponse(
+        message=decision.message,
+        outcome=decision.outcome,
+        links=[]
+    ))
+    print(f"\n{CLI_BLUE}=== TASK COMPLETE ==={CLI_CLR}")
+    print(f"{CLI_GREEN}Outcome:{CLI_CLR} {decision.outcome}")
+    print(f"{CLI_GREEN}Message:{CLI_CLR} {decision.message}")
+
+
+def prepare_task(
+    store_api: CachingDispatcher,
+    about: Any,
+    task: TaskInfo,
+    llm_client,
+) -> Tuple[Any, List[dict], type[NextStep]]:
+    """Wiki, initial conversation and step schema of a task
+
+    Makes blocking API calls (wiki, current employee).
+
+    Returns:
+        (wiki index, conversation log, NextStep variant for the user's access level)
+    """
+    # Load wiki pages to understand company rules and context
+    # (cached for the whole session, fetched concurrently on first use)
+    wiki_content = {}
+    try:
+        wiki_content = get_wiki_store().get_pages(
+            store_api,
+            version=getattr(about, "wiki_sha1", None),
+            log=lambda msg: print(f"{CLI_YELLOW}{msg}{CLI_CLR}"),
+        )
+        for path in wiki_content:
+            if 'rulebook' in path.lower() or 'rule' in path.lower():
+                print(f"{CLI_YELLOW}Found rulebook: {path}{CLI_CLR}")
+    except Exception as e:
+        print(f"{CLI_RED}Could not load wiki: {e}{CLI_CLR}")
+
+    # Static prefix (rules + rulebook) is byte-identical across tasks so that
+    # provider prompt caching can reuse it; per-task context goes after it
+    wiki_index = get_wiki_index(wiki_content)
+    static_prompt = SYSTEM_RULES
+    rulebook = wiki_index.rulebook_context()
+    if rulebook:
+        static_prompt += "\n\n# COMPANY RULEBOOK:\n" + rulebook
+
+    context_prompt = f"# Current user context:\n{about.model_dump_json()}"
+
     # Add user info if available
+    usr = None
     if about.current_user:
         try:
-            usr = store_api.get_employee(about.current_user)
-            system_prompt += f"\n# Current user details:\n{usr.model_dump_json()}"
+            usr = store_api.dispatch(dev.Req_GetEmployee(id=about.current_user))
+            context_prompt += f"\n\n# Current user details:\n{usr.model_dump_json()}"
         except:
             pass
 
-    # Add wiki content to system prompt
-    if wiki_content:
-        system_prompt += "\n\n# COMPANY WIKI AND RULES:\n"
-        for path, content in wiki_content.items():
-            system_prompt += f"\n## {path}\n{content}\n"
+    # Add the wiki sections most relevant to this task
+    relevant_wiki = wiki_index.relevant_context(
+        task.task_text, token_budget=WIKI_TOKEN_BUDGET, top_k=WIKI_TOP_K)
+    if relevant_wiki:
+        context_prompt += "\n\n# COMPANY WIKI (most relevant sections):\n" + relevant_wiki
 
     # Conversation log
-    log = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": task.task_text},
-    ]
-
-    # Reasoning loop with limit
-    for i in range(25):
-        step = f"step_{i + 1}"
-        print(f"\n{CLI_BLUE}=== Step {i+1} ==={CLI_CLR}")
-        
-        started = time.time()
+    log = llm_client.build_messages(static_prompt, context_prompt, task.task_text)
 
-        try:
-            # Use universal LLM client
-            job, usage = llm_client.parse_completion(
-                messages=log,
-                response_format=NextStep,
-                max_tokens=16384,
-            )
-            
-            duration = time.time() - started
-
-            # Log to ERC3 platform
-            api.log_llm(
-                task_id=task.task_id,
-                model=llm_client.get_model_name(),
-                duration_sec=duration,
-                usage=type('Usage', (), usage)(),  # Convert dict to object
-            )
-
-            # Print reasoning
-            print(f"{CLI_YELLOW}Thoughts:{CLI_CLR} {job.thoughts[:150]}...")
-            print(f"{CLI_YELLOW}Security:{CLI_CLR} {job.security_check[:100]}...")
-            print(f"{CLI_YELLOW}Next:{CLI_CLR} {job.plan_remaining_steps_brief[0]}")
-            print(f"{CLI_YELLOW}Function:{CLI_CLR} {job.function.__class__.__name__}")
-
-        except Exception as e:
-            print(f"{CLI_RED}LLM Error: {e}{CLI_CLR}")
-            # Try to respond with error
-            store_api.dispatch(dev.Req_ProvideAgentResponse(
-                message=f"I encountered an error processing your request: {str(e)}",
-                outcome="error_internal",
-                links=[]
-            ))
-            break
-
-        # Add to conversation history
-        log.append({
-            "role": "assistant",
-            "content": f"{job.thoughts}\n\nNext step: {job.plan_remaining_steps_brief[0]}",
-            "tool_calls": [{
-                "type": "function",
-                "id": step,
-                "function": {
-                    "name": job.function.__class__.__name__,
-                    "arguments": job.function.model_dump_json(),
-                }}]
-        })
-
-        # Execute the tool
-        try:
-            result = store_api.dispatch(job.function)
-            txt = result.model_dump_json(exclude_none=True, exclude_unset=True)
-            print(f"{CLI_GREEN}✓ SUCCESS:{CLI_CLR} {txt[:200]}...")
-            
-        except ApiException as e:
-            txt = f"API Error: {e.api_error.error}\nDetails: {e.detail}"
-            print(f"{CLI_RED}✗ API ERROR: {e.api_error.error}{CLI_CLR}")
-            print(f"{CLI_RED}  Details: {e.detail}{CLI_CLR}")
-            
-        except Exception as e:
-            txt = f"Unexpected error: {str(e)}"
-            print(f"{CLI_RED}✗ ERROR: {e}{CLI_CLR}")
-
-        # Check if task completed
-        if isinstance(job.function, dev.Req_ProvideAgentResponse):
-            print(f"\n{CLI_BLUE}=== TASK COMPLETE ==={CLI_CLR}")
-            print(f"{CLI_GREEN}Outcome:{CLI_CLR} {job.function.outcome}")
-            print(f"{CLI_GREEN}Message:{CLI_CLR} {job.function.message}")
-            if job.function.links:
-                print(f"{CLI_GREEN}Links:{CLI_CLR}")
-                for link in job.function.links:
-                    print(f"  - {link.kind}: {link.id}")
-            break
-
-        # Add result to conversation
-        log.append({"role": "tool", "content": txt, "tool_call_id": step})
+    level = access_level(about, usr)
+    step_model = next_step_model(level)
+    print(f"{CLI_BLUE}Access level:{CLI_CLR} {level} "
+          f"({len(get_args(step_model.model_fields['function'].annotation))} tools)")
+    return wiki_index, log, step_model
+
+
+def execute_tool(
+    store_api: CachingDispatcher,
+    wiki_index,
+    encoder: ResultEncoder,
+    function: BaseModel,
+    fetch_all_pages: bool,
+    record: dict,
+) -> Tuple[str, bool]:
+    """Run one tool call; returns (text for the conversation, succeeded)
+
+    Timings are appended to record["dispatch"]. May run on a worker
+    thread, so it must not print.
+    """
+    started = time.time()
+    timing = {"request": function.__class__.__name__}
+    try:
+        # Local wiki search and result expansion never leave the process
+        if isinstance(function, Req_SearchWikiLocal):
+            result = wiki_index.lookup(function)
+        elif isinstance(function, Req_ExpandResult):
+            result = encoder.expand(function)
+        elif fetch_all_pages and is_paged_request(function):
+            result = drain_pages(store_api.dispatch, function, max_items=PAGINATION_MAX_ITEMS)
+        else:
+            result = store_api.dispatch(function)
+            if isinstance(function, dev.Req_UpdateWikiPage):
+                get_wiki_store().invalidate()
+        timing["sec"] = round(time.time() - started, 4)
+        serialize_started = time.time()
+        if isinstance(function, Req_ExpandResult):
+            # Already chunked; shortening it again would defeat the purpose
+            txt = result.model_dump_json(exclude_none=True)
+            timing["raw_bytes"] = len(txt.encode("utf-8"))
+        else:
+            # Wiki text is what the agent asked to read: only the byte cap applies
+            txt, timing["raw_bytes"] = encoder.encode(result, full_text=isinstance(function, WIKI_TEXT_TOOLS))
+        timing["serialize_sec"] = round(time.time() - serialize_started, 6)
+        ok = True
+    except ApiException as e:
+        txt, ok = f"API Error: {e.api_error.error}\nDetails: {e.detail}", False
+    except Exception as e:
+        txt, ok = f"Unexpected error: {str(e)}", False
+    timing.setdefault("sec", round(time.time() - started, 4))
+    timing["bytes"] = len(txt.encode("utf-8"))
+    timing["ok"] = ok
+    record["dispatch"].append(timing)
+    return txt, ok
+
+
+def early_dispatch_callback(start: Callable[[BaseModel, bool], Any]) -> Tuple[Callable[[str, Any], None], list]:
+    """
+    on_field callback that starts API reads as soon as they are streamed
+
+    Reads are complete once their field is; later fields are still being
+    generated. The dispatch cache hands the in-flight results to the regular
+    execution of the step. parallel_reads are ignored when the step answers
+    (see step_calls), so they are not started once the streamed `function`
+    - which precedes them in NextStep - is a Req_ProvideAgentResponse.
+
+    Args:
+        start: Starts one read, given (request, fetch_all_pages); returns a handle
+
+    Returns:
+        (callback for parse_completion, list collecting the handles)
+    """
+    streamed = {}
+    started = []
+
+    def on_field(name, value):
+        streamed[name] = value
+        if name == "function":
+            items = [value]
+        elif name == "parallel_reads" and isinstance(value, list):
+            if "function" in streamed and is_streamed_response(streamed["function"]):
+                return
+            items = value
+        else:
+            return
+        for raw in items:
+            request = decode_streamed_read(raw)
+            if request is not None:
+                started.append(start(request, bool(streamed.get("fetch_all_pages"))))
+
+    return (on_field if EARLY_DISPATCH else None), started
+
+
+def record_llm_call(record: dict, duration: float, usage: dict, early: list):
+    record.update(
+        llm_sec=round(duration, 4),
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens"),
+        cached_tokens=usage.get("cached_tokens"),
+        client_sec=usage.get("client_sec"),
+        first_token_sec=usage.get("first_token_sec"),
+        early_dispatch=len(early),
+        tier=usage.get("tier"),
+        escalation=usage.get("escalation"),
+        tiers=usage.get("tiers"),
+        cache_hit=bool(usage.get("cache_hit")),
+    )
 
+
+def print_step(job: NextStep, usage: dict, compactor: ConversationCompactor, early: list):
+    """Print reasoning of a step"""
+    print(f"{CLI_YELLOW}Thoughts:{CLI_CLR} {job.thoughts[:150]}...")
+    print(f"{CLI_YELLOW}Security:{CLI_CLR} {job.security_check[:100]}...")
+    print(f"{CLI_YELLOW}Next:{CLI_CLR} {job.plan_remaining_steps_brief[0]}")
+    print(f"{CLI_YELLOW}Function:{CLI_CLR} {job.function.__class__.__name__}")
+    if usage.get("escalation"):
+        print(f"{CLI_YELLOW}Model:{CLI_CLR} escalated to {usage['tiers'][-1]['model']} ({usage['escalation']})")
+    elif usage.get("tier"):
+        print(f"{CLI_YELLOW}Model:{CLI_CLR} {usage['tiers'][-1]['model']} ({usage['tier']})")
+    if early:
+        print(f"{CLI_YELLOW}Early dispatch:{CLI_CLR} {len(early)} read(s) started during generation")
+    if usage.get("cache_hit"):
+        print(f"{CLI_YELLOW}Tokens:{CLI_CLR} none (served from the response cache)")
     else:
-        # Hit max iterations
-        print(f"{CLI_RED}Max iterations reached!{CLI_CLR}")
-        try:
-            store_api.dispatch(dev.Req_ProvideAgentResponse(
-                message="I've reached my reasoning limit. Please try breaking this down into smaller requests.",
-                outcome="error_internal",
-                links=[]
-            ))
-        except:
-            pass
+        print(f"{CLI_YELLOW}Tokens:{CLI_CLR} {usage['prompt_tokens']} prompt "
+              f"({usage.get('cached_tokens', 0)} cached), {usage['completion_tokens']} completion")
+    if compactor.last_compacted_tokens < compactor.last_original_tokens:
+        print(f"{CLI_YELLOW}Context:{CLI_CLR} compacted ~{compactor.last_original_tokens} "
+              f"-> ~{compactor.last_compacted_tokens} tokens")
+
+
+def step_calls(job: NextStep, step: str) -> Tuple[List[BaseModel], List[str], dict]:
+    """Tool calls of a step, their ids and the assistant message announcing them"""
+    # Extra reads are pointless once the agent responds
+    calls = [job.function]
+    if not isinstance(job.function, dev.Req_ProvideAgentResponse):
+        calls += job.parallel_reads
+    call_ids = [step] + [f"{step}_{k}" for k in range(1, len(calls))]
+    if len(calls) > 1:
+        print(f"{CLI_YELLOW}Parallel:{CLI_CLR} {', '.join(c.__class__.__name__ for c in calls[1:])}")
+
+    message = {
+        "role": "assistant",
+        "content": f"{job.thoughts}\n\nNext step: {job.plan_remaining_steps_brief[0]}",
+        "tool_calls": [{
+            "type": "function",
+            "id": call_id,
+            "function": {
+                "name": call.__class__.__name__,
+                "arguments": call.model_dump_json(),
+            }} for call_id, call in zip(call_ids, calls)]
+    }
+    return calls, call_ids, message
+
+
+def finish_tools(
+    job: NextStep,
+    calls: List[BaseModel],
+    call_ids: List[str],
+    outputs: List[Tuple[str, bool]],
+    record: dict,
+    serialize_sec: float,
+    log: List[dict],
+) -> bool:
+    """Record and print tool results; append them to the log unless the task is done
+
+    Returns:
+        True when the agent gave its final response
+    """
+    metrics = get_metrics()
+    serialize_sec += sum(t.get("serialize_sec", 0.0) for t in record["dispatch"])
+    record["serialize_sec"] = round(serialize_sec, 6)
+    record["error"] = not all(ok for _, ok in outputs)
+    metrics.finish_step(record)
+
+    for call, (txt, ok) in zip(calls, outputs):
+        if ok:
+            print(f"{CLI_GREEN}✓ SUCCESS:{CLI_CLR} {txt[:200]}...")
+        else:
+            print(f"{CLI_RED}✗ {call.__class__.__name__}: {txt}{CLI_CLR}")
+
+    # Check if task completed
+    if isinstance(job.function, dev.Req_ProvideAgentResponse):
+        print(f"\n{CLI_BLUE}=== TASK COMPLETE ==={CLI_CLR}")
+        print(f"{CLI_GREEN}Outcome:{CLI_CLR} {job.function.outcome}")
+        print(f"{CLI_GREEN}Message:{CLI_CLR} {job.function.message}")
+        if job.function.links:
+            print(f"{CLI_GREEN}Links:{CLI_CLR}")
+            for link in job.function.links:
+                print(f"  - {link.kind}: {link.id}")
+        return True
+
+    # Add results to conversation
+    for call_id, (txt, _) in zip(call_ids, outputs):
+        log.append({"role": "tool", "content": txt, "tool_call_id": call_id})
+    return False
+
+
+def error_response(e: Exception) -> dev.Req_ProvideAgentResponse:
+    return dev.Req_ProvideAgentResponse(
+        message=f"I encountered an error processing your request: {str(e)}",
+        outcome="error_internal",
+        links=[]
+    )
+
+
+def limit_response() -> dev.Req_ProvideAgentResponse:
+    return dev.Req_ProvideAgentResponse(
+        message="I've reached my reasoning limit. Please try breaking this down into smaller requests.",
+        outcome="error_internal",
+        links=[]
+    )
+
+
+def print_cache_stats(store_api: CachingDispatcher, prefetcher: Optional[Prefetcher] = None):
+    stats = store_api.stats()
+    print(f"{CLI_BLUE}Dispatch cache:{CLI_CLR} {stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['invalidations']} invalidated")
+    if stats["prefetches"]:
+        print(f"{CLI_BLUE}Prefetch:{CLI_CLR} {stats['prefetch_hits']} of {stats['prefetches']} prefetched reads used")
+    if prefetcher is not None:
+        if prefetcher.invalid:
+            print(f"{CLI_YELLOW}Prefetch:{CLI_CLR} {prefetcher.invalid} referenced ids rejected by the request models")
+        for problem in prefetcher.problems:
+            print(f"{CLI_RED}Prefetch problem:{CLI_CLR} {problem}")
+
+
+def note_response(checkpoint: Optional[TaskCheckpoint]):
+    """Mark the task answered before the answer is sent, so --resume never sends a second one"""
+    if checkpoint is not None:
+        checkpoint.mark_responded()
+
+
+def note_write(checkpoint: Optional[TaskCheckpoint], step_index: int, log: List[dict],
+               calls: List[BaseModel], call_ids: List[str]):
+    """Save the step's tool calls before its write is sent, so --resume knows it may have happened"""
+    write = calls[0]
+    if checkpoint is None or is_read_tool(write) or isinstance(write, dev.Req_ProvideAgentResponse):
+        return
+    checkpoint.mark_write_pending(step_index + 1, log, call_ids[0])
+
+
+# Tool results fed back for a step that was cut off while sending its write
+PENDING_WRITE_NOTE = ("The run was interrupted while this call was being sent; it may or may not have "
+                      "been applied. Check the current state before repeating it, so it is not done twice.")
+LOST_READ_NOTE = "The run was interrupted before this result was saved; repeat the call if it is still needed."
+
+
+def resume_point(checkpoint: Optional[TaskCheckpoint], log: List[dict]) -> Tuple[int, List[dict]]:
+    """Step to start from and the log to continue, restored from a checkpoint if there is one"""
+    saved = checkpoint.load() if checkpoint is not None else None
+    if saved is None:
+        return 0, log
+    step, saved_log = saved
+    pending = checkpoint.pending_write()
+    if pending is not None and saved_log and saved_log[-1].get("role") == "assistant":
+        # The log ends with the interrupted step's calls: answer them with notes
+        for tool_call in saved_log[-1].get("tool_calls", []):
+            note = PENDING_WRITE_NOTE if tool_call["id"] == pending else LOST_READ_NOTE
+            saved_log.append({"role": "tool", "content": note, "tool_call_id": tool_call["id"]})
+        print(f"{CLI_YELLOW}A write may have been sent before the restart; the agent is told to check{CLI_CLR}")
+    print(f"{CLI_BLUE}Resuming at step {step + 1} ({len(saved_log)} messages restored){CLI_CLR}")
+    return step, saved_log
+
+
+def run_agent(model: str, api: ERC3, task: TaskInfo, llm_provider: str = "auto",
+              checkpoint: Optional[TaskCheckpoint] = None):
+    """Enhanced agent with Wiki support, better security, and error handling
+
+    Args:
+        model: Model name (e.g., "gpt-4o", "gemini-2.0-flash-exp")
+        api: ERC3 API instance
+        task: Task information
+        llm_provider: "openai", "google", or "auto" (default: auto-detect)
+        checkpoint: Saves the log after every step (a saved log is continued),
+            before each write, and marks the task answered before the final
+            response goes out
+    """
+
+    metrics = get_metrics()
+    setup_record = metrics.start_step(task.task_id, 0, kind="setup")
+
+    # Guests asking for company data and similar clear-cut cases are
+    # answered before the wiki is loaded
+    store_api, about, decision = open_task(api, task)
+    if decision is not None:
+        note_response(checkpoint)
+        answer_fast_path(store_api, decision)
+        setup_record["fast_path"] = decision.reason
+        metrics.finish_step(setup_record)
+        return
+
+    # Initialize LLM client
+    # (recording/replaying when main.py runs with AGENT_CASSETTE_MODE)
+    llm_client = make_llm_client(api, task.task_id, llm_provider, model)
+    print(f"{CLI_BLUE}Using LLM: {llm_client.get_provider_name()} / {llm_client.get_model_name()}{CLI_CLR}")
+
+    # Entities the results point at are fetched while the LLM thinks
+    prefetcher = make_prefetcher(store_api, about)
+    try:
+        wiki_index, log, step_model = prepare_task(store_api, about, task, llm_client)
+        first_step, log = resume_point(checkpoint, log)
+        encoder = ResultEncoder()
+        compactor = ConversationCompactor(CONTEXT_TOKEN_BUDGET, CONTEXT_KEEP_LAST)
+        metrics.finish_step(setup_record)
+
+        # Reasoning loop with limit
+        for i in range(first_step, 25):
+            step = f"step_{i + 1}"
+            print(f"\n{CLI_BLUE}=== Step {i+1} ==={CLI_CLR}")
+            record = metrics.start_step(task.task_id, i + 1)
+
+            started = time.time()
+
+            if prefetcher is not None:
+                record["prefetched"] = prefetcher.start()
+
+            try:
+                # Use universal LLM client
+                with ThreadPoolExecutor(max_workers=5, thread_name_prefix="early") as early_pool:
+                    on_field, early = early_dispatch_callback(lambda request, fetch_all: early_pool.submit(
+                        execute_tool, store_api, wiki_index, encoder, request, fetch_all, {"dispatch": []}))
+                    job, usage = llm_client.parse_completion(
+                        messages=compactor.compact(log),
+                        response_format=step_model,
+                        max_tokens=16384,
+                        on_field=on_field,
+                    )
+
+                duration = time.time() - started
+                record_llm_call(record, duration, usage, early)
+
+                # Log to ERC3 platform
+                api.log_llm(
+                    task_id=task.task_id,
+                    model=llm_client.get_model_name(),
+                    duration_sec=duration,
+                    usage=type('Usage', (), usage)(),  # Convert dict to object
+                )
+
+                print_step(job, usage, compactor, early)
+
+            except Exception as e:
+                print(f"{CLI_RED}LLM Error: {e}{CLI_CLR}")
+                record["error"] = True
+                metrics.finish_step(record)
+                # Try to respond with error
+                note_response(checkpoint)
+                store_api.dispatch(error_response(e))
+                break
+
+            # Add to conversation history
+            serialize_started = time.time()
+            calls, call_ids, message = step_calls(job, step)
+            log.append(message)
+            serialize_sec = time.time() - serialize_started
+            if isinstance(job.function, dev.Req_ProvideAgentResponse):
+                note_response(checkpoint)
+
+            # Execute the tools: all independent reads first (concurrently when
+            # there are several), then a write in `function` (if any) on its own,
+            # so a step always sees the state from before its write
+            outputs: List[Optional[Tuple[str, bool]]] = [None] * len(calls)
+            reads = [k for k, call in enumerate(calls) if is_read_tool(call)]
+            if len(reads) > 1:
+                with ThreadPoolExecutor(max_workers=len(reads), thread_name_prefix="tool") as pool:
+                    results = pool.map(
+                        lambda k: execute_tool(store_api, wiki_index, encoder, calls[k], job.fetch_all_pages, record),
+                        reads)
+                    for k, output in zip(reads, results):
+                        outputs[k] = output
+            else:
+                for k in reads:
+                    outputs[k] = execute_tool(store_api, wiki_index, encoder, calls[k], job.fetch_all_pages, record)
+            note_write(checkpoint, i, log, calls, call_ids)
+            for k, call in enumerate(calls):
+                if outputs[k] is None:
+                    outputs[k] = execute_tool(store_api, wiki_index, encoder, call, job.fetch_all_pages, record)
+
+            if finish_tools(job, calls, call_ids, outputs, record, serialize_sec, log):
+                break
+            if checkpoint is not None:
+                checkpoint.save(i + 1, log)
+
+        else:
+            # Hit max iterations
+            print(f"{CLI_RED}Max iterations reached!{CLI_CLR}")
+            try:
+                note_response(checkpoint)
+                store_api.dispatch(limit_response())
+            except:
+                pass
+    finally:
+        # No speculative read may outlive the task
+        if prefetcher is not None:
+            prefetcher.close()
+    print_cache_stats(store_api, prefetcher)
+
+
+async def run_agent_async(model: str, api: ERC3, task: TaskInfo, llm_provider: str = "auto",
+                          checkpoint: Optional[TaskCheckpoint] = None):
+    """run_agent on an event loop: same steps, prompts and results
+
+    The LLM call is awaited (AsyncLLMClient); ERC3 calls, which have no async
+    client, run in the default executor so the loop keeps serving other tasks.
+    Not available in cassette record/replay mode.
+    """
+    metrics = get_metrics()
+    setup_record = metrics.start_step(task.task_id, 0, kind="setup")
+
+    store_api, about, decision = await asyncio.to_thread(open_task, api, task)
+    if decision is not None:
+        await asyncio.to_thread(note_response, checkpoint)
+        await asyncio.to_thread(answer_fast_path, store_api, decision)
+        setup_record["fast_path"] = decision.reason
+        metrics.finish_step(setup_record)
+        return
+
+    llm_client = make_cascade_client(AsyncLLMClient, llm_provider, model, task.task_id)
+    print(f"{CLI_BLUE}Using LLM: {llm_client.get_provider_name()} / {llm_client.get_model_name()}{CLI_CLR}")
+
+    prefetcher = make_prefetcher(store_api, about)
+    try:
+        wiki_index, log, step_model = await asyncio.to_thread(prepare_task, store_api, about, task, llm_client)
+        first_step, log = resume_point(checkpoint, log)
+        encoder = ResultEncoder()
+        compactor = ConversationCompactor(CONTEXT_TOKEN_BUDGET, CONTEXT_KEEP_LAST)
+        metrics.finish_step(setup_record)
+
+        def run_tool(function: BaseModel, fetch_all_pages: bool, record: dict):
+            return asyncio.to_thread(execute_tool, store_api, wiki_index, encoder, function, fetch_all_pages, record)
+
+        for i in range(first_step, 25):
+            step = f"step_{i + 1}"
+            print(f"\n{CLI_BLUE}=== Step {i+1} ==={CLI_CLR}")
+            record = metrics.start_step(task.task_id, i + 1)
+
+            started = time.time()
+
+            if prefetcher is not None:
+                record["prefetched"] = prefetcher.start()
+
+            try:
+                on_field, early = early_dispatch_callback(
+                    lambda request, fetch_all: asyncio.ensure_future(run_tool(request, fetch_all, {"dispatch": []})))
+                try:
+                    job, usage = await llm_client.parse_completion(
+                        messages=compactor.compact(log),
+                        response_format=step_model,
+                        max_tokens=16384,
+                        on_field=on_field,
+                    )
+                finally:
+                    await asyncio.gather(*early, return_exceptions=True)
+
+                duration = time.time() - started
+                record_llm_call(record, duration, usage, early)
+
+                await asyncio.to_thread(
+                    api.log_llm,
+                    task_id=task.task_id,
+                    model=llm_client.get_model_name(),
+                    duration_sec=duration,
+                    usage=type('Usage', (), usage)(),
+                )
+
+                print_step(job, usage, compactor, early)
+
+            except Exception as e:
+                print(f"{CLI_RED}LLM Error: {e}{CLI_CLR}")
+                record["error"] = True
+                metrics.finish_step(record)
+                await asyncio.to_thread(note_response, checkpoint)
+                await asyncio.to_thread(store_api.dispatch, error_response(e))
+                break
+
+            serialize_started = time.time()
+            calls, call_ids, message = step_calls(job, step)
+            log.append(message)
+            serialize_sec = time.time() - serialize_started
+            if isinstance(job.function, dev.Req_ProvideAgentResponse):
+                await asyncio.to_thread(note_response, checkpoint)
+
+            # All reads first (concurrently), then a write in `function` on its own
+            outputs: List[Optional[Tuple[str, bool]]] = [None] * len(calls)
+            reads = [k for k, call in enumerate(calls) if is_read_tool(call)]
+            results = await asyncio.gather(*(run_tool(calls[k], job.fetch_all_pages, record) for k in reads))
+            for k, output in zip(reads, results):
+                outputs[k] = output
+            await asyncio.to_thread(note_write, checkpoint, i, log, calls, call_ids)
+            for k, call in enumerate(calls):
+                if outputs[k] is None:
+                    outputs[k] = await run_tool(call, job.fetch_all_pages, record)
+
+            if finish_tools(job, calls, call_ids, outputs, record, serialize_sec, log):
+                break
+            if checkpoint is not None:
+                await asyncio.to_thread(checkpoint.save, i + 1, log)
+
+        else:
+            print(f"{CLI_RED}Max iterations reached!{CLI_CLR}")
+            try:
+                await asyncio.to_thread(note_response, checkpoint)
+                await asyncio.to_thread(store_api.dispatch, limit_response())
+            except:
+                pass
+    finally:
+        # No speculative read may outlive the task
+        if prefetcher is not None:
+            await asyncio.to_thread(prefetcher.close)
+    print_cache_stats(store_api, prefetcher)
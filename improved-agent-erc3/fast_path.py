@@ -0,0 +1,91 @@
+"""
+Deterministic answers for tasks that need no LLM (guests, forbidden requests)
+"""
+import os
+import re
+from typing import Any, Optional
+from pydantic import BaseModel
+
+
+# Set AGENT_FAST_PATH=0 to send every task through the LLM loop
+FAST_PATH_ENABLED = os.getenv("AGENT_FAST_PATH", "1") != "0"
+
+# Asking for the date and nothing else
+_DATE_ONLY = re.compile(
+    r"^\s*(please\s+)?(what|which|tell me)(\s+is|'s)?\s+(the\s+)?"
+    r"(today'?s?\s+date|date\s+(is\s+it\s+)?today|day\s+is\s+(it\s+)?today|current\s+date)"
+    r"(\s+is\s+it)?\s*[?.!]*\s*$",
+    re.IGNORECASE,
+)
+
+# Company data a guest may never see; only unmistakable terms, everyday
+# words ("team", "hours", "update") are left to the LLM
+_INTERNAL_DATA = re.compile(
+    r"\b(salar(y|ies)|payroll|wages?|"
+    r"time\s*(entr(y|ies)|sheets?)|timesheets?|"
+    r"(employee|staff)\s+(records?|list|directory|e-?mails?|phone\s+numbers?|(home\s+)?address(es)?|"
+    r"personal\s+data|performance\s+reviews?))\b",
+    re.IGNORECASE,
+)
+
+# Wiping company data in bulk
+_WIPE_DATA = re.compile(
+    r"\b(wipe|erase|purge|delete)\s+(all|every|the\s+(whole|entire))\s+"
+    r"(company\s+)?(data(base)?|records|employees|projects|customers|time\s*entries|wiki)\b",
+    re.IGNORECASE,
+)
+
+# Longer requests mix several asks; a keyword hit there is not conclusive
+_MAX_DECIDED_WORDS = 25
+
+
+class FastPathDecision(BaseModel):
+    outcome: str
+    message: str
+    reason: str
+
+
+def classify(about: Any, task_text: str) -> Optional[FastPathDecision]:
+    """
+    Decide a task up front from who_am_i and the request text
+
+    Only guests are decided here, and only for unambiguous cases: a bare
+    date question, or a short request that names confidential data. Anything
+    else returns None and goes through the normal agent loop.
+
+    Args:
+        about: who_am_i response of the task
+        task_text: The user's request
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    text = task_text.strip()
+    is_guest = bool(getattr(about, "is_public", False)) and not getattr(about, "current_user", None)
+    # Signed-in users may be entitled to what they ask; only the LLM can tell
+    if not is_guest:
+        return None
+
+    today = getattr(about, "today", None)
+    if today and _DATE_ONLY.match(text):
+        return FastPathDecision(
+            outcome="ok_answer",
+            message=f"Today's date is {today}.",
+            reason="guest date question",
+        )
+
+    if len(text.split()) > _MAX_DECIDED_WORDS:
+        return None
+    if _WIPE_DATA.search(text):
+        return FastPathDecision(
+            outcome="denied_security",
+            message="Sorry, wiping or deleting company data is not permitted.",
+            reason="guest asking to wipe data",
+        )
+    if _INTERNAL_DATA.search(text):
+        return FastPathDecision(
+            outcome="denied_security",
+            message="Sorry, I can't share internal company information with guest users. "
+                    "Please sign in with an employee account.",
+            reason="guest asking for internal data",
+        )
+    return None
@@ -0,0 +1,149 @@
+"""
+Optional on-disk cache of structured LLM responses (development reruns)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+
+# SQLite file of the cache (unset = no caching)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+# LLM_CACHE_BYPASS=1: always call the model, but store fresh responses
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+
+_MESSAGE_KEYS = ("role", "content", "tool_calls", "tool_call_id")
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Messages reduced to what the provider sees, with trailing whitespace stripped"""
+    normalized = []
+    for msg in messages:
+        item = {k: msg[k] for k in _MESSAGE_KEYS if k in msg}
+        if isinstance(item.get("content"), str):
+            item["content"] = item["content"].rstrip()
+        normalized.append(item)
+    return normalized
+
+
+def cache_key(provider: str, model: str, messages: List[Dict[str, Any]], schema: Dict[str, Any], max_tokens: int) -> str:
+    payload = json.dumps(
+        {
+            "provider": provider,
+            "model": model,
+            "messages": normalize_messages(messages),
+            "schema": schema,
+            "max_tokens": max_tokens,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite-backed response cache with LRU eviction and a TTL
+
+    Values are the parsed response (JSON) plus the usage of the original
+    call. Shared by all clients and threads of the process.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl_hours: float = 168):
+        """
+        Args:
+            path: SQLite file
+            max_entries: Entries kept; least recently used ones are evicted
+            ttl_hours: Entries older than this are treated as missing
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_hours * 3600
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, parsed TEXT NOT NULL, usage TEXT NOT NULL,"
+                " created REAL NOT NULL, used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+
+    def get(self, key: str, response_format: type[BaseModel]) -> Optional[Tuple[BaseModel, Dict[str, Any]]]:
+        """Cached (parsed, usage) for key, or None"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT parsed, usage, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[2] > self.ttl_sec:
+                with self._db:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            with self._db:
+                self._db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        try:
+            parsed = response_format.model_validate_json(row[0])
+        except Exception:
+            # Schema changed in a way the key didn't capture: treat as a miss
+            return None
+        return parsed, json.loads(row[1])
+
+    def put(self, key: str, parsed: BaseModel, usage: Dict[str, Any]):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, parsed, usage, created, used) VALUES (?, ?, ?, ?, ?)",
+                (key, parsed.model_dump_json(), json.dumps(usage, default=str), now, now),
+            )
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+def cached_usage(usage: Dict[str, Any]) -> Dict[str, Any]:
+    """Usage reported for a cache hit: nothing was sent to the provider"""
+    return {
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "cached_tokens": 0,
+        "cache_hit": True,
+        "original_usage": usage,
+    }
+
+
+_default_cache: Optional[LLMResponseCache] = None
+_default_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Process-wide cache, or None when LLM_CACHE_PATH is not set"""
+    global _default_cache
+    if not LLM_CACHE_PATH:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_HOURS)
+        return _default_cache
@@ -3,25 +3,73 @@ LLM Client wrapper supporting both OpenAI and Google Gemini
 """
 import os
 import time
+import asyncio
 import json
-from typing import Optional, Dict, Any, List
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple, Callable
 from pydantic import BaseModel
+from llm_cache import LLM_CACHE_BYPASS, cache_key, cached_usage, get_llm_cache
+from rate_limiter import estimate_request_tokens, get_scheduler
+from streaming_json import StreamingObjectParser
+
+
+# Provider-side prompt prefix caching (set LLM_PREFIX_CACHE=0 to disable)
+PREFIX_CACHE_ENABLED = os.getenv("LLM_PREFIX_CACHE", "1") != "0"
+GEMINI_CACHE_TTL_MIN = int(os.getenv("GEMINI_CACHE_TTL_MIN", "60"))
+
+# Stream responses when the caller wants fields early (set LLM_STREAMING=0 to disable)
+STREAMING_ENABLED = os.getenv("LLM_STREAMING", "1") != "0"
+
+# Gemini cached-content handles shared by all clients in the process:
+# {prefix key: (handle or None, expires_at)}
+_gemini_caches: Dict[str, tuple] = {}
+_gemini_caches_lock = threading.Lock()
+# Handles being created, so concurrent callers of one prefix wait for a single
+# create call while other prefixes proceed: {prefix key: Future}
+_gemini_caches_pending: Dict[str, Future] = {}
+
+# GenerativeModel objects memoized per (model, response_format, system prompt, max_tokens):
+# {key: (model, expires_at)}
+_gemini_models: "OrderedDict[tuple, tuple]" = OrderedDict()
+_gemini_models_lock = threading.Lock()
+_GEMINI_MODELS_MAX = 32
+
+
+def _usage_tokens(result: Tuple[BaseModel, Dict[str, Any]]) -> Optional[int]:
+    """Total tokens reported for a parse_completion result"""
+    return result[1].get("total_tokens")
+
+
+@lru_cache(maxsize=64)
+def _schema_for(response_format: type[BaseModel]) -> Tuple[Dict[str, Any], str]:
+    """JSON schema of a response model and its rendering for the prompt (computed once)"""
+    schema = response_format.model_json_schema()
+    return schema, json.dumps(schema, indent=2)
 
 
 class LLMClient:
     """Universal LLM client supporting OpenAI and Google Gemini"""
     
-    def __init__(self, provider: str = "auto", model: Optional[str] = None):
+    def __init__(self, provider: str = "auto", model: Optional[str] = None, task_key: Optional[str] = None):
         """
         Initialize LLM client
         
         Args:
             provider: "openai", "google", or "auto" (auto-detect from env vars)
             model: Model name (optional, will use defaults if not provided)
+            task_key: Task this client works for (fair share of the rate limit)
         """
+        self.task_key = task_key or f"client-{id(self)}"
         self.provider = self._detect_provider(provider)
         self.model = model or self._get_default_model()
         self.client = self._initialize_client()
+        # Gemini messages converted so far (see _convert_messages_incremental)
+        self._converted: Dict[str, Any] = {"messages": [], "system_instruction": "", "contents": []}
         
     def _detect_provider(self, provider: str) -> str:
         """Detect which provider to use based on environment variables"""
@@ -56,7 +104,8 @@ class LLMClient:
         """Initialize the appropriate client"""
         if self.provider == "openai":
             from openai import OpenAI
-            return OpenAI()
+            # Retries belong to the scheduler, which charges each attempt against the quota
+            return OpenAI(max_retries=0)
         elif self.provider == "google":
             import google.generativeai as genai
             api_key = os.getenv("GOOGLE_API_KEY")
@@ -67,11 +116,41 @@ class LLMClient:
         else:
             raise ValueError(f"Unsupported provider: {self.provider}")
     
+    @staticmethod
+    def build_messages(
+        static_prompt: str,
+        context_prompt: str,
+        user_text: str,
+    ) -> List[Dict[str, Any]]:
+        """
+        Build the initial conversation with a cacheable prefix
+
+        The first system message must be byte-identical across tasks (rules,
+        rulebook); anything task-specific goes into the second one. Both
+        providers treat the first system message as the cached prefix.
+
+        Args:
+            static_prompt: Task-independent part of the system prompt
+            context_prompt: Per-task context (current user, relevant wiki)
+            user_text: The task itself
+        """
+        return [
+            {"role": "system", "content": static_prompt},
+            {"role": "system", "content": context_prompt},
+            {"role": "user", "content": user_text},
+        ]
+
+    def _prefix_key(self, prefix: str) -> str:
+        """Stable identifier of a prompt prefix for this provider/model"""
+        raw = f"{self.provider}\n{self.model}\n{prefix}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
     def parse_completion(
         self, 
         messages: List[Dict[str, Any]], 
         response_format: type[BaseModel],
-        max_tokens: int = 16384
+        max_tokens: int = 16384,
+        on_field: Optional[Callable[[str, Any], None]] = None,
     ) -> tuple[BaseModel, Dict[str, Any]]:
         """
         Get structured completion from LLM
@@ -80,37 +159,117 @@ class LLMClient:
             messages: Conversation messages
             response_format: Pydantic model for structured output
             max_tokens: Maximum tokens to generate
+            on_field: Called with (name, raw JSON value) for each top-level
+                field as soon as it has been generated; turns on streaming.
+                Runs on the calling thread while generation continues.
             
         Returns:
             Tuple of (parsed_response, usage_stats)
         """
+        if not STREAMING_ENABLED:
+            on_field = None
+        key, hit = self._cache_lookup(messages, response_format, max_tokens, on_field)
+        if hit is not None:
+            return hit
         if self.provider == "openai":
-            return self._openai_parse(messages, response_format, max_tokens)
+            call = lambda: self._openai_parse(messages, response_format, max_tokens, on_field)
         elif self.provider == "google":
-            return self._google_parse(messages, response_format, max_tokens)
+            call = lambda: self._google_parse(messages, response_format, max_tokens, on_field)
         else:
             raise ValueError(f"Unsupported provider: {self.provider}")
+        # Shared RPM/TPM quota, fair across tasks; 429/5xx are retried with backoff
+        result = get_scheduler().call(
+            self.task_key, estimate_request_tokens(messages), call, _usage_tokens)
+        self._cache_store(key, result)
+        return result
+
+    def _cache_lookup(
+        self,
+        messages: List[Dict[str, Any]],
+        response_format: type[BaseModel],
+        max_tokens: int,
+        on_field: Optional[Callable[[str, Any], None]],
+    ) -> Tuple[Optional[str], Optional[tuple]]:
+        """Response cache key (None = caching off) and the cached result, if any"""
+        cache = get_llm_cache()
+        if cache is None:
+            return None, None
+        key = cache_key(self.provider, self.model, messages, _schema_for(response_format)[0], max_tokens)
+        hit = None if LLM_CACHE_BYPASS else cache.get(key, response_format)
+        if hit is None:
+            return key, None
+        parsed, usage = hit
+        if on_field is not None:
+            # Same callbacks as a stream, all at once
+            for name, value in parsed.model_dump(mode="json").items():
+                on_field(name, value)
+        return key, (parsed, cached_usage(usage))
+
+    def _cache_store(self, key: Optional[str], result: tuple):
+        if key is not None and result[0] is not None:
+            get_llm_cache().put(key, result[0], result[1])
     
     def _openai_parse(
         self, 
         messages: List[Dict[str, Any]], 
         response_format: type[BaseModel],
-        max_tokens: int
+        max_tokens: int,
+        on_field: Optional[Callable[[str, Any], None]] = None,
     ) -> tuple[BaseModel, Dict[str, Any]]:
-        """OpenAI structured output"""
-        completion = self.client.beta.chat.completions.parse(
-            model=self.model,
-            response_format=response_format,
-            messages=messages,
-            max_completion_tokens=max_tokens,
-        )
-        
+        """OpenAI structured output (streamed when on_field is given)"""
+        extra = self._openai_extra(messages)
+        first_token_sec = None
+        if on_field is None:
+            completion = self.client.beta.chat.completions.parse(
+                model=self.model,
+                response_format=response_format,
+                messages=messages,
+                max_completion_tokens=max_tokens,
+                **extra,
+            )
+        else:
+            started = time.time()
+            parser = StreamingObjectParser()
+            with self.client.beta.chat.completions.stream(
+                model=self.model,
+                response_format=response_format,
+                messages=messages,
+                max_completion_tokens=max_tokens,
+                stream_options={"include_usage": True},
+                **extra,
+            ) as stream:
+                for event in stream:
+                    if event.type != "content.delta":
+                        continue
+                    if first_token_sec is None:
+                        first_token_sec = time.time() - started
+                    for name, value in parser.feed(event.delta):
+                        on_field(name, value)
+                completion = stream.get_final_completion()
+
+        return self._openai_result(completion, first_token_sec)
+
+    def _openai_extra(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Extra request options shared by all OpenAI calls"""
+        # Automatic prompt caching hits on identical prefixes; the cache key
+        # routes requests sharing our static system prompt to the same cache
+        extra = {}
+        if PREFIX_CACHE_ENABLED and messages and messages[0]["role"] == "system":
+            extra["prompt_cache_key"] = self._prefix_key(messages[0]["content"])
+        return extra
+
+    def _openai_result(self, completion, first_token_sec: Optional[float]) -> tuple[BaseModel, Dict[str, Any]]:
+        """Parsed response and usage dict of a finished OpenAI completion"""
         parsed = completion.choices[0].message.parsed
+        details = getattr(completion.usage, "prompt_tokens_details", None)
         usage = {
             "prompt_tokens": completion.usage.prompt_tokens,
             "completion_tokens": completion.usage.completion_tokens,
             "total_tokens": completion.usage.total_tokens,
+            "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
         }
+        if first_token_sec is not None:
+            usage["first_token_sec"] = round(first_token_sec, 4)
         
         return parsed, usage
     
@@ -118,36 +277,58 @@ class LLMClient:
         self, 
         messages: List[Dict[str, Any]], 
         response_format: type[BaseModel],
-        max_tokens: int
+        max_tokens: int,
+        on_field: Optional[Callable[[str, Any], None]] = None,
     ) -> tuple[BaseModel, Dict[str, Any]]:
-        """Google Gemini structured output using JSON mode"""
-        
-        # Convert messages to Gemini format
-        gemini_messages = self._convert_messages_to_gemini(messages)
-        
-        # Get schema from Pydantic model
-        schema = response_format.model_json_schema()
-        
-        # Add schema instruction to system message
-        system_content = gemini_messages.get("system_instruction", "")
-        system_content += f"\n\nYou must respond with valid JSON matching this schema:\n{json.dumps(schema, indent=2)}"
-        
-        # Create model with generation config
-        model = self.client.GenerativeModel(
-            model_name=self.model,
-            system_instruction=system_content,
-            generation_config={
-                "temperature": 1.0,
-                "max_output_tokens": max_tokens,
-                "response_mime_type": "application/json",
-                "response_schema": schema,
-            }
-        )
+        """Google Gemini structured output using JSON mode (streamed when on_field is given)"""
+        model, contents, client_sec = self._google_prepare(messages, response_format, max_tokens)
         
         # Generate response
-        response = model.generate_content(gemini_messages["contents"])
+        first_token_sec = None
+        if on_field is None:
+            response = model.generate_content(contents)
+        else:
+            started = time.time()
+            parser = StreamingObjectParser()
+            response = model.generate_content(contents, stream=True)
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk without text parts (e.g. only safety/usage data)
+                    continue
+                if first_token_sec is None:
+                    first_token_sec = time.time() - started
+                for name, value in parser.feed(text):
+                    on_field(name, value)
+
+        return self._google_result(response, response_format, client_sec, first_token_sec)
+
+    def _google_prepare(
+        self,
+        messages: List[Dict[str, Any]],
+        response_format: type[BaseModel],
+        max_tokens: int,
+    ) -> Tuple[Any, List[Dict[str, Any]], float]:
+        """Model object and contents for a Gemini call, plus the client-side time spent"""
+        prepare_started = time.time()
+
+        # Convert messages to Gemini format (only the ones added since the last call)
+        system_instruction, contents = self._convert_messages_incremental(messages)
         
-        # Parse JSON response
+        # Model object (with schema and system prompt) is reused across steps
+        model = self._get_gemini_model(response_format, system_instruction, max_tokens)
+        return model, contents, time.time() - prepare_started
+
+    def _google_result(
+        self,
+        response,
+        response_format: type[BaseModel],
+        client_sec: float,
+        first_token_sec: Optional[float],
+    ) -> tuple[BaseModel, Dict[str, Any]]:
+        """Parsed response and usage dict of a finished Gemini response"""
+        # Parse JSON response (a streamed response aggregates the chunks)
         try:
             json_data = json.loads(response.text)
             parsed = response_format.model_validate(json_data)
@@ -166,52 +347,174 @@ class LLMClient:
             "prompt_tokens": getattr(response.usage_metadata, "prompt_token_count", 0),
             "completion_tokens": getattr(response.usage_metadata, "candidates_token_count", 0),
             "total_tokens": getattr(response.usage_metadata, "total_token_count", 0),
+            "cached_tokens": getattr(response.usage_metadata, "cached_content_token_count", 0) or 0,
+            # Client-side time spent on message conversion and schema/model setup
+            "client_sec": round(client_sec, 6),
         }
+        if first_token_sec is not None:
+            usage["first_token_sec"] = round(first_token_sec, 4)
         
         return parsed, usage
-    
-    def _convert_messages_to_gemini(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Convert OpenAI-style messages to Gemini format"""
-        system_instruction = ""
-        contents = []
+
+    def _get_gemini_model(
+        self,
+        response_format: type[BaseModel],
+        system_instruction: str,
+        max_tokens: int,
+    ):
+        """Return a memoized GenerativeModel for this model/schema/system prompt"""
+        key = (self.model, response_format, system_instruction, max_tokens)
+        with _gemini_models_lock:
+            model, expires_at = _gemini_models.get(key, (None, 0.0))
+            if model is not None and time.time() < expires_at:
+                _gemini_models.move_to_end(key)
+                return model
+
+        schema, schema_text = _schema_for(response_format)
         
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"]
-            
-            if role == "system":
-                system_instruction += content + "\n"
-            elif role == "user":
-                contents.append({
-                    "role": "user",
-                    "parts": [{"text": content}]
-                })
-            elif role == "assistant":
-                # For assistant messages with tool_calls, format them
-                if "tool_calls" in msg:
-                    tool_text = content + "\n\nTool calls:\n"
-                    for tc in msg["tool_calls"]:
-                        tool_text += f"- {tc['function']['name']}: {tc['function']['arguments']}\n"
-                    contents.append({
-                        "role": "model",
-                        "parts": [{"text": tool_text}]
-                    })
-                else:
-                    contents.append({
-                        "role": "model",
-                        "parts": [{"text": content}]
-                    })
-            elif role == "tool":
-                # Tool results go as user messages
-                contents.append({
-                    "role": "user",
-                    "parts": [{"text": f"Tool result:\n{content}"}]
-                })
+        # Add schema instruction to system message
+        system_content = system_instruction
+        system_content += f"\n\nYou must respond with valid JSON matching this schema:\n{schema_text}"
         
-        return {
-            "system_instruction": system_instruction.strip(),
-            "contents": contents
+        generation_config = {
+            "temperature": 1.0,
+            "max_output_tokens": max_tokens,
+            "response_mime_type": "application/json",
+            "response_schema": schema,
         }
+
+        # Create model with generation config, on top of the cached prefix if possible
+        cached_content = self._get_gemini_cache(system_content) if PREFIX_CACHE_ENABLED else None
+        if cached_content is not None:
+            model = self.client.GenerativeModel.from_cached_content(
+                cached_content=cached_content,
+                generation_config=generation_config,
+            )
+            # Must not outlive the cached-content handle it points to
+            with _gemini_caches_lock:
+                expires_at = _gemini_caches.get(self._prefix_key(system_content), (None, 0.0))[1]
+        else:
+            model = self.client.GenerativeModel(
+                model_name=self.model,
+                system_instruction=system_content,
+                generation_config=generation_config,
+            )
+            expires_at = float("inf")
+
+        with _gemini_models_lock:
+            _gemini_models[key] = (model, expires_at)
+            while len(_gemini_models) > _GEMINI_MODELS_MAX:
+                _gemini_models.popitem(last=False)
+        return model
+
+    def _get_gemini_cache(self, system_content: str):
+        """Create (once) and return a cached-content handle for the system prefix
+
+        Returns None when the prefix can't be cached, e.g. because it is below
+        the provider's minimum cacheable size; that result is remembered too.
+        """
+        key = self._prefix_key(system_content)
+        with _gemini_caches_lock:
+            handle, expires_at = _gemini_caches.get(key, (None, 0.0))
+            if key in _gemini_caches and time.time() < expires_at:
+                return handle
+            pending = _gemini_caches_pending.get(key)
+            if pending is None:
+                pending = _gemini_caches_pending[key] = Future()
+                creating = True
+            else:
+                creating = False
+        if not creating:
+            return pending.result()
+
+        # The network call runs outside the lock
+        ttl = datetime.timedelta(minutes=GEMINI_CACHE_TTL_MIN)
+        handle = None
+        try:
+            from google.generativeai import caching
+            model_name = self.model if self.model.startswith("models/") else f"models/{self.model}"
+            handle = caching.CachedContent.create(
+                model=model_name,
+                system_instruction=system_content,
+                ttl=ttl,
+            )
+        except Exception as e:
+            print(f"Gemini prefix caching unavailable: {e}")
+        finally:
+            with _gemini_caches_lock:
+                # Refresh a minute before the provider expires the handle
+                _gemini_caches[key] = (handle, time.time() + ttl.total_seconds() - 60)
+                del _gemini_caches_pending[key]
+            pending.set_result(handle)
+        return handle
+    
+    def _convert_messages_incremental(self, messages: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """Convert messages to Gemini format, reusing the previous call's work
+
+        The agent loop only appends to its log, so everything up to the last
+        converted message is taken from the previous result. If earlier
+        messages were replaced (identity check), conversion starts over.
+        """
+        state = self._converted
+        seen = state["messages"]
+        if len(messages) < len(seen) or any(a is not b for a, b in zip(messages, seen)):
+            state = self._converted = {"messages": [], "system_instruction": "", "contents": []}
+            seen = state["messages"]
+
+        for idx in range(len(seen), len(messages)):
+            msg = messages[idx]
+            system_text, content = self._convert_message(idx, msg)
+            if system_text is not None:
+                state["system_instruction"] = (state["system_instruction"] + system_text + "\n").strip()
+            if content is not None:
+                state["contents"].append(content)
+            seen.append(msg)
+
+        return state["system_instruction"], list(state["contents"])
+
+    def _convert_message(self, idx: int, msg: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Convert one message; returns (system instruction text, Gemini content)
+
+        Only the first system message becomes the (cacheable) system
+        instruction; later system messages carry per-task context and are
+        passed as user turns.
+        """
+        role = msg["role"]
+        content = msg["content"]
+        
+        if role == "system" and idx == 0:
+            return content, None
+        elif role == "system":
+            return None, {
+                "role": "user",
+                "parts": [{"text": f"Context:\n{content}"}]
+            }
+        elif role == "user":
+            return None, {
+                "role": "user",
+                "parts": [{"text": content}]
+            }
+        elif role == "assistant":
+            # For assistant messages with tool_calls, format them
+            if "tool_calls" in msg:
+                tool_text = content + "\n\nTool calls:\n"
+                for tc in msg["tool_calls"]:
+                    tool_text += f"- {tc['function']['name']}: {tc['function']['arguments']}\n"
+                return None, {
+                    "role": "model",
+                    "parts": [{"text": tool_text}]
+                }
+            return None, {
+                "role": "model",
+                "parts": [{"text": content}]
+            }
+        elif role == "tool":
+            # Tool results go as user messages
+            return None, {
+                "role": "user",
+                "parts": [{"text": f"Tool result:\n{content}"}]
+            }
+        return None, None
     
     def get_model_name(self) -> str:
         """Get the current model name"""
@@ -222,6 +525,115 @@ class LLMClient:
         return self.provider
 
 
+class AsyncLLMClient(LLMClient):
+    """LLMClient with an awaitable parse_completion (AsyncOpenAI / Gemini async generate)
+
+    Same arguments, return value, caching and streaming behaviour as
+    LLMClient; many tasks can share one event loop instead of one thread each.
+    """
+
+    def _initialize_client(self):
+        """Initialize the appropriate async client"""
+        if self.provider == "openai":
+            from openai import AsyncOpenAI
+            return AsyncOpenAI(max_retries=0)
+        # google.generativeai models expose generate_content_async
+        return super()._initialize_client()
+
+    async def parse_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        response_format: type[BaseModel],
+        max_tokens: int = 16384,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> tuple[BaseModel, Dict[str, Any]]:
+        """Async counterpart of LLMClient.parse_completion (on_field runs on the event loop)"""
+        if not STREAMING_ENABLED:
+            on_field = None
+        key, hit = self._cache_lookup(messages, response_format, max_tokens, on_field)
+        if hit is not None:
+            return hit
+        if self.provider == "openai":
+            call = lambda: self._openai_parse_async(messages, response_format, max_tokens, on_field)
+        elif self.provider == "google":
+            call = lambda: self._google_parse_async(messages, response_format, max_tokens, on_field)
+        else:
+            raise ValueError(f"Unsupported provider: {self.provider}")
+        result = await get_scheduler().call_async(
+            self.task_key, estimate_request_tokens(messages), call, _usage_tokens)
+        self._cache_store(key, result)
+        return result
+
+    async def _openai_parse_async(
+        self,
+        messages: List[Dict[str, Any]],
+        response_format: type[BaseModel],
+        max_tokens: int,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> tuple[BaseModel, Dict[str, Any]]:
+        extra = self._openai_extra(messages)
+        first_token_sec = None
+        if on_field is None:
+            completion = await self.client.beta.chat.completions.parse(
+                model=self.model,
+                response_format=response_format,
+                messages=messages,
+                max_completion_tokens=max_tokens,
+                **extra,
+            )
+        else:
+            started = time.time()
+            parser = StreamingObjectParser()
+            async with self.client.beta.chat.completions.stream(
+                model=self.model,
+                response_format=response_format,
+                messages=messages,
+                max_completion_tokens=max_tokens,
+                stream_options={"include_usage": True},
+                **extra,
+            ) as stream:
+                async for event in stream:
+                    if event.type != "content.delta":
+                        continue
+                    if first_token_sec is None:
+                        first_token_sec = time.time() - started
+                    for name, value in parser.feed(event.delta):
+                        on_field(name, value)
+                completion = await stream.get_final_completion()
+
+        return self._openai_result(completion, first_token_sec)
+
+    async def _google_parse_async(
+        self,
+        messages: List[Dict[str, Any]],
+        response_format: type[BaseModel],
+        max_tokens: int,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> tuple[BaseModel, Dict[str, Any]]:
+        # Creating the prefix cache on first use is a blocking call
+        model, contents, client_sec = await asyncio.to_thread(
+            self._google_prepare, messages, response_format, max_tokens)
+
+        first_token_sec = None
+        if on_field is None:
+            response = await model.generate_content_async(contents)
+        else:
+            started = time.time()
+            parser = StreamingObjectParser()
+            response = await model.generate_content_async(contents, stream=True)
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue
+                if first_token_sec is None:
+                    first_token_sec = time.time() - started
+                for name, value in parser.feed(text):
+                    on_field(name, value)
+
+        return self._google_result(response, response_format, client_sec, first_token_sec)
+
+
 # Example usage
 if __name__ == "__main__":
     # Test auto-detection
@@ -0,0 +1,821 @@
+"""
+In-process stand-in for the ERC3 dev and store backends (load and scaling tests)
+"""
+import argparse
+import datetime
+import enum
+import hashlib
+import os
+import random
+import threading
+import time
+import types
+from types import SimpleNamespace
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple, Union, get_args, get_origin
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from erc3 import ApiException, erc3 as dev, store
+
+
+# ---------------------------------------------------------------------------
+# SDK shapes
+#
+# Records and responses are built from the SDK's own models: synthetic values
+# are kept only for fields the SDK has, required fields without one get a
+# placeholder, and every difference is noted in `shape_drift()` so a smoke
+# run shows where the stand-in and the SDK disagree.
+# ---------------------------------------------------------------------------
+
+# Responses not named "Resp_" + the request name without "Req_"
+_RESPONSE_NAMES = {"Req_ListProducts": "Resp_ProductListPage"}
+
+_drift: Dict[str, Set[str]] = {}
+_drift_lock = threading.Lock()
+_adapters: Dict[Tuple[type, str], TypeAdapter] = {}
+
+
+def _note_drift(model: type[BaseModel], kind: str, names):
+    if not names:
+        return
+    with _drift_lock:
+        _drift.setdefault(f"{model.__name__}: {kind}", set()).update(names)
+
+
+def shape_drift() -> Dict[str, List[str]]:
+    """{"<model>: <kind>": field names} for every difference seen so far"""
+    with _drift_lock:
+        return {key: sorted(names) for key, names in sorted(_drift.items())}
+
+
+def response_model(request_name: str, module=dev) -> type[BaseModel]:
+    """The SDK's response model of a request"""
+    name = _RESPONSE_NAMES.get(request_name, "Resp_" + request_name[len("Req_"):])
+    model = getattr(module, name, None)
+    if not (isinstance(model, type) and issubclass(model, BaseModel)):
+        raise api_error("unsupported", f"the SDK has no {name} for {request_name}")
+    return model
+
+
+def _unwrap(annotation: Any) -> Any:
+    """The annotation without Optional[...]"""
+    if get_origin(annotation) in (Union, types.UnionType):
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _is_model(annotation: Any) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+def list_field(model: type[BaseModel]) -> Optional[Tuple[str, Any]]:
+    """(name, item type) of the first list field of a model"""
+    for name, field in model.model_fields.items():
+        annotation = _unwrap(field.annotation)
+        if get_origin(annotation) is list:
+            args = get_args(annotation)
+            return name, (args[0] if args else Any)
+    return None
+
+
+def entity_field(model: type[BaseModel]) -> Optional[Tuple[str, type[BaseModel]]]:
+    """(name, model) of the first field holding one nested model"""
+    for name, field in model.model_fields.items():
+        annotation = _unwrap(field.annotation)
+        if _is_model(annotation):
+            return name, annotation
+    return None
+
+
+def _placeholder(annotation: Any) -> Any:
+    """A value of the annotated type for required fields without synthetic data"""
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin in (Union, types.UnionType):
+        return None if type(None) in args else _placeholder(args[0])
+    if origin is Literal:
+        return args[0]
+    if origin in (list, set, tuple, frozenset):
+        return []
+    if origin is dict:
+        return {}
+    if _is_model(annotation):
+        return build(annotation, {}).model_dump(mode="json")
+    if isinstance(annotation, type):
+        if issubclass(annotation, enum.Enum):
+            return next(iter(annotation)).value
+        if issubclass(annotation, bool):
+            return False
+        if issubclass(annotation, (int, float)):
+            return 0
+        if issubclass(annotation, datetime.date):
+            return "2025-06-02"
+    return ""
+
+
+def build(model: type[BaseModel], values: Dict[str, Any]) -> BaseModel:
+    """Instance of an SDK model from `values`; validation errors are real shape mismatches"""
+    fields = {}
+    missing = []
+    for name, field in model.model_fields.items():
+        if name in values:
+            fields[name] = values[name]
+        elif field.is_required():
+            fields[name] = _placeholder(field.annotation)
+            missing.append(name)
+    _note_drift(model, "not provided", missing)
+    _note_drift(model, "not in the SDK", [name for name in values if name not in model.model_fields])
+    return model.model_validate(fields)
+
+
+def conform(model: type[BaseModel], record: Dict[str, Any]) -> Dict[str, Any]:
+    """A synthetic draft reduced to the SDK model's fields, as JSON data
+
+    Draft values the SDK types differently are replaced by placeholders.
+    """
+    values = {}
+    retyped = []
+    for name, field in model.model_fields.items():
+        if name not in record:
+            continue
+        key = (model, name)
+        adapter = _adapters.get(key)
+        if adapter is None:
+            adapter = _adapters[key] = TypeAdapter(field.annotation)
+        try:
+            values[name] = adapter.validate_python(record[name])
+        except ValidationError:
+            retyped.append(name)
+    # Draft fields the SDK doesn't have are simply not used
+    _note_drift(model, "typed differently", retyped)
+    return build(model, values).model_dump(mode="json")
+
+
+def record_model(request_name: str, module=dev) -> type[BaseModel]:
+    """Model of the records a Get*/List* response carries"""
+    model = response_model(request_name, module)
+    entity = entity_field(model)
+    if entity is not None:
+        return entity[1]
+    items = list_field(model)
+    if items is not None and _is_model(items[1]):
+        return items[1]
+    return model
+
+
+def api_error(error: str, detail: str) -> Exception:
+    """Build an error the agents handle like a real API error"""
+    # Built without __init__: the agents only read these attributes
+    exc = ApiException.__new__(ApiException)
+    exc.api_error = SimpleNamespace(error=error)
+    exc.detail = detail
+    return exc
+
+
+# ---------------------------------------------------------------------------
+# Synthetic dataset
+# ---------------------------------------------------------------------------
+
+_FIRST = ["anna", "felix", "lena", "jonas", "mia", "paul", "sara", "tom", "eva", "lukas", "nina", "max"]
+_LAST = ["baum", "keller", "wolf", "berger", "huber", "schmid", "wagner", "bauer", "fuchs", "koch"]
+_DEPARTMENTS = ["Engineering", "Sales", "Consulting", "Finance", "HR", "Operations"]
+_LOCATIONS = ["Vienna", "Munich", "Zurich", "Berlin"]
+_SKILLS = ["python", "sql", "ml", "cv", "cloud", "sales", "negotiation", "rust", "react", "spark"]
+_STATUSES = ["idea", "exploring", "active", "paused", "archived"]
+_WORDS = ["line", "vision", "data", "forecast", "portal", "sensor", "quality", "pricing", "cloud", "audit"]
+
+
+# Synthetic tables and the request whose response carries their records
+_RECORD_TABLES = (
+    ("employees", "Req_GetEmployee", dev),
+    ("customers", "Req_GetCustomer", dev),
+    ("projects", "Req_GetProject", dev),
+    ("time_entries", "Req_GetTimeEntry", dev),
+    ("products", "Req_ListProducts", store),
+)
+
+
+def generate_dataset(
+    seed: int = 0,
+    employees: int = 50,
+    projects: int = 20,
+    customers: int = 15,
+    time_entries: int = 500,
+    wiki_pages: int = 10,
+    products: int = 200,
+    coupons: int = 10,
+) -> Dict[str, Any]:
+    """Deterministic synthetic company + store data of the requested size
+
+    Records are drafted with plausible values, then reduced to the fields of
+    the SDK's models (wiki pages and coupons are internal to this backend).
+    """
+    rnd = random.Random(seed)
+    data: Dict[str, Any] = {}
+
+    emps = {}
+    for i in range(employees):
+        emp_id = f"{rnd.choice(_FIRST)}_{rnd.choice(_LAST)}_{i}"
+        emps[emp_id] = {
+            "id": emp_id,
+            "name": emp_id.rsplit("_", 1)[0].replace("_", " ").title(),
+            "email": f"{emp_id}@aetherion.example",
+            "department": rnd.choice(_DEPARTMENTS),
+            "location": rnd.choice(_LOCATIONS),
+            "role": "CEO" if i == 0 else ("Project Lead" if i % 7 == 1 else "Engineer"),
+            "salary": rnd.randrange(50_000, 150_000, 1000),
+            "skills": rnd.sample(_SKILLS, 3),
+            "notes": "",
+        }
+    data["employees"] = emps
+    emp_ids = list(emps)
+
+    custs = {}
+    for i in range(customers):
+        cust_id = f"cust_{rnd.choice(_WORDS)}_{i}"
+        custs[cust_id] = {
+            "id": cust_id,
+            "name": f"{rnd.choice(_WORDS).title()} {rnd.choice(['GmbH', 'AG', 'Ltd'])}",
+            "location": rnd.choice(_LOCATIONS),
+            "account_manager": rnd.choice(emp_ids),
+            "deal_phase": rnd.choice(["lead", "qualified", "won", "lost"]),
+        }
+    data["customers"] = custs
+    cust_ids = list(custs)
+
+    projs = {}
+    for i in range(projects):
+        proj_id = f"proj_{rnd.choice(_WORDS)}_{rnd.choice(_WORDS)}_{i}"
+        team = rnd.sample(emp_ids, min(len(emp_ids), rnd.randint(2, 6)))
+        projs[proj_id] = {
+            "id": proj_id,
+            "name": proj_id[5:].rsplit("_", 1)[0].replace("_", " ").title(),
+            "customer": rnd.choice(cust_ids) if cust_ids else None,
+            "status": rnd.choice(_STATUSES),
+            "lead": team[0],
+            "team": [{"employee": e, "role": "Lead" if k == 0 else "Member", "time_slice": 0.5} for k, e in enumerate(team)],
+        }
+    data["projects"] = projs
+    proj_ids = list(projs)
+
+    entries = {}
+    for i in range(time_entries if proj_ids else 0):
+        proj = projs[rnd.choice(proj_ids)]
+        entry_id = f"te_{i}"
+        entries[entry_id] = {
+            "id": entry_id,
+            "employee": rnd.choice(proj["team"])["employee"],
+            "project": proj["id"],
+            "customer": proj["customer"],
+            "date": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+            "hours": rnd.choice([0.5, 1, 2, 4, 8]),
+            "billable": rnd.random() < 0.8,
+            "notes": rnd.choice(["", "workshop", "review", "implementation"]),
+            "status": "draft",
+        }
+    data["time_entries"] = entries
+
+    wiki = {"rulebook.md": "# Rulebook\n\n## Access\nOnly executives see salaries.\n\n## Time\nLog time daily."}
+    for i in range(max(0, wiki_pages - 1)):
+        topic = rnd.choice(_WORDS)
+        body = "\n\n".join(
+            f"## {rnd.choice(_WORDS).title()} {k}\n" + " ".join(rnd.choice(_WORDS) for _ in range(60))
+            for k in range(4)
+        )
+        wiki[f"{topic}/page_{i}.md"] = f"# {topic.title()} {i}\n\n{body}"
+    data["wiki"] = wiki
+
+    data["products"] = {
+        f"SKU-{i:05d}": {
+            "sku": f"SKU-{i:05d}",
+            "name": f"{rnd.choice(_WORDS).title()} {rnd.choice(['Kit', 'Pack', 'Module', 'Cable', 'Board'])} {i}",
+            "price": round(rnd.uniform(1, 500), 2),
+            "available": rnd.randint(0, 50),
+        }
+        for i in range(products)
+    }
+    data["coupons"] = {
+        f"SAVE{5 * (i + 1)}": {"percent": 5 * (i + 1) % 50 or 5, "min_total": float(rnd.choice([0, 50, 100, 250]))}
+        for i in range(coupons)
+    }
+
+    # Only what the SDK models have is kept (see conform)
+    for table, request_name, module in _RECORD_TABLES:
+        model = record_model(request_name, module)
+        data[table] = {key: conform(model, record) for key, record in data[table].items()}
+    return data
+
+
+# ---------------------------------------------------------------------------
+# Clients
+# ---------------------------------------------------------------------------
+
+_PAGING_FIELDS = ("tool", "offset", "limit")
+
+
+def _fields(request: Any) -> Dict[str, Any]:
+    return {k: v for k, v in request.model_dump().items() if k not in _PAGING_FIELDS and v not in (None, "", [])}
+
+
+def _first(request: Any, *names: str) -> Any:
+    for name in names:
+        value = getattr(request, name, None)
+        if value:
+            return value
+    return None
+
+
+def _matches(entity: Dict[str, Any], criteria: Dict[str, Any]) -> bool:
+    """Loose match: every criterion must appear somewhere in the entity"""
+    text = repr(entity).lower()
+    for value in criteria.values():
+        if isinstance(value, (dict, list)):
+            continue
+        if str(value).lower() not in text:
+            return False
+    return True
+
+
+def _items_response(request_name: str, items: List[Dict[str, Any]], module=dev, **values) -> BaseModel:
+    """Response of a request whose result is a list (pages, searches, summaries)"""
+    model = response_model(request_name, module)
+    field = list_field(model)
+    if field is None:
+        raise api_error("unsupported", f"{model.__name__} has no list field")
+    name, item = field
+    if _is_model(item):
+        items = [conform(item, i) for i in items]
+    return build(model, {name: items, **values})
+
+
+class _LocalClient:
+    """Shared plumbing: latency, error injection, pagination, counters"""
+
+    module = dev
+
+    def __init__(self, backend: "LocalERC3"):
+        self.backend = backend
+
+    def _call(self, name: str):
+        self.backend.count(name)
+        if self.backend.latency_sec > 0:
+            time.sleep(self.backend.latency_sec * (0.5 + self.backend.random()))
+        if self.backend.error_rate > 0 and self.backend.random() < self.backend.error_rate:
+            self.backend.count("errors_injected")
+            raise api_error("internal_error", f"injected failure in {name}")
+
+    def _page(self, request: Any, items: List[Dict[str, Any]]):
+        offset = getattr(request, "offset", 0) or 0
+        limit = min(getattr(request, "limit", None) or self.backend.page_size, self.backend.page_size)
+        page = items[offset:offset + limit]
+        next_offset = offset + limit if offset + limit < len(items) else -1
+        self.backend.count("pages_served")
+        return _items_response(type(request).__name__, page, self.module, next_offset=next_offset)
+
+
+class LocalDevClient(_LocalClient):
+    """Stand-in for api.get_erc_dev_client(task)"""
+
+    def __init__(self, backend: "LocalERC3", current_user: Optional[str]):
+        super().__init__(backend)
+        self.current_user = current_user
+
+    def who_am_i(self):
+        self._call("who_am_i")
+        emp = self.backend.data["employees"].get(self.current_user or "", {})
+        return build(response_model("Req_WhoAmI"), {
+            "current_user": self.current_user,
+            "is_public": self.current_user is None,
+            "location": emp.get("location"),
+            "department": emp.get("department"),
+            "today": "2025-06-02",
+            "wiki_sha1": self.backend.wiki_sha1(),
+        })
+
+    def list_wiki_pages(self):
+        self._call("list_wiki_pages")
+        return build(response_model("Req_ListWikiPages"), {"paths": sorted(self.backend.data["wiki"])})
+
+    def load_wiki_page(self, path: str):
+        self._call("load_wiki_page")
+        return self._load_wiki_page(path)
+
+    def _load_wiki_page(self, path: Optional[str]):
+        if path not in self.backend.data["wiki"]:
+            raise api_error("not_found", f"wiki page {path} not found")
+        return build(response_model("Req_LoadWikiPage"), {"file": path, "content": self.backend.data["wiki"][path]})
+
+    def get_employee(self, employee_id: str):
+        self._call("get_employee")
+        return self._get("Req_GetEmployee", "employees", employee_id)
+
+    def dispatch(self, request: Any) -> Any:
+        name = type(request).__name__
+        self._call(name)
+        data = self.backend.data
+        with self.backend.lock:
+            if name == "Req_ListEmployees":
+                return self._page(request, list(data["employees"].values()))
+            if name == "Req_ListProjects":
+                return self._page(request, list(data["projects"].values()))
+            if name == "Req_ListCustomers":
+                return self._page(request, list(data["customers"].values()))
+            if name.startswith("Req_Search"):
+                return self._search(name, request)
+            if name == "Req_GetEmployee":
+                return self._get(name, "employees", _first(request, "id", "employee"))
+            if name == "Req_GetProject":
+                return self._get(name, "projects", _first(request, "id", "project"))
+            if name == "Req_GetCustomer":
+                return self._get(name, "customers", _first(request, "id", "customer"))
+            if name == "Req_GetTimeEntry":
+                return self._get(name, "time_entries", _first(request, "id", "entry"))
+            if name.startswith("Req_TimeSummary"):
+                return self._summary(name, request)
+            if name == "Req_ListWikiPages":
+                return build(response_model(name), {"paths": sorted(data["wiki"])})
+            if name == "Req_LoadWikiPage":
+                return self._load_wiki_page(_first(request, "file", "path"))
+            if name.startswith("Req_Update") or name == "Req_LogTimeEntry":
+                return self._write(name, request)
+            if name == "Req_ProvideAgentResponse":
+                self.backend.responses.append(request.model_dump())
+                return build(response_model(name), {})
+        raise api_error("unsupported", f"{name} is not implemented by the local backend")
+
+    def _get(self, name: str, table: str, entity_id: Optional[str]):
+        entity = self.backend.data[table].get(entity_id or "")
+        if entity is None:
+            raise api_error("not_found", f"{table} {entity_id} not found")
+        model = response_model(name)
+        field = entity_field(model)
+        return build(model, {field[0]: entity} if field else entity)
+
+    def _search(self, name: str, request: Any):
+        criteria = _fields(request)
+        data = self.backend.data
+        if name == "Req_SearchWiki":
+            pattern = str(_first(request, "query_regex", "query") or "").lower()
+            results = [
+                {"path": path, "linum": n + 1, "content": line}
+                for path, content in sorted(data["wiki"].items())
+                for n, line in enumerate(content.splitlines())
+                if pattern and pattern in line.lower()
+            ]
+            return _items_response(name, results[:50])
+        table = {
+            "Req_SearchEmployees": "employees",
+            "Req_SearchProjects": "projects",
+            "Req_SearchCustomers": "customers",
+            "Req_SearchTimeEntries": "time_entries",
+        }.get(name)
+        if table is None:
+            raise api_error("unsupported", f"{name} is not implemented by the local backend")
+        matches = [e for e in data[table].values() if _matches(e, criteria)]
+        return self._page(request, matches)
+
+    def _summary(self, name: str, request: Any):
+        key = "project" if name.endswith("ByProject") else "employee"
+        criteria = _fields(request)
+        totals: Dict[str, Dict[str, float]] = {}
+        for entry in self.backend.data["time_entries"].values():
+            if not _matches(entry, criteria):
+                continue
+            row = totals.setdefault(str(entry.get(key)), {"hours": 0.0, "billable_hours": 0.0})
+            hours = entry.get("hours") or 0.0
+            row["hours"] += hours
+            if entry.get("billable"):
+                row["billable_hours"] += hours
+        return _items_response(name, [{key: k, **v} for k, v in sorted(totals.items())])
+
+    def _write(self, name: str, request: Any):
+        data = self.backend.data
+        fields = _fields(request)
+        model = response_model(name)
+        if name == "Req_LogTimeEntry":
+            entry_id = f"te_{len(data['time_entries'])}"
+            entry = conform(record_model("Req_GetTimeEntry"), {"id": entry_id, **fields})
+            data["time_entries"][entry_id] = entry
+            return self._written(model, entry_id, entry)
+        if name == "Req_UpdateWikiPage":
+            path = _first(request, "file", "path")
+            data["wiki"][path] = getattr(request, "content", "")
+            return self._written(model, path, None)
+        table = {
+            "Req_UpdateEmployeeInfo": "employees",
+            "Req_UpdateProjectTeam": "projects",
+            "Req_UpdateProjectStatus": "projects",
+            "Req_UpdateTimeEntry": "time_entries",
+        }.get(name)
+        if table is None:
+            raise api_error("unsupported", f"{name} is not implemented by the local backend")
+        entity_id = _first(request, "id", "employee", "project", "entry")
+        entity = data[table].get(entity_id or "")
+        if entity is None:
+            raise api_error("not_found", f"{entity_id} not found")
+        entity.update({k: v for k, v in fields.items() if k != "id" and k in entity})
+        return self._written(model, entity_id, entity)
+
+    @staticmethod
+    def _written(model: type[BaseModel], entity_id: str, entity: Optional[Dict[str, Any]]) -> BaseModel:
+        """Response of a write; it may echo the id or the changed entity"""
+        values: Dict[str, Any] = {}
+        if "id" in model.model_fields:
+            values["id"] = entity_id
+        field = entity_field(model)
+        if field is not None and entity is not None:
+            values[field[0]] = entity
+        return build(model, values)
+
+
+class LocalStoreClient(_LocalClient):
+    """Stand-in for api.get_store_client(task) with a per-task basket"""
+
+    module = store
+
+    def __init__(self, backend: "LocalERC3"):
+        super().__init__(backend)
+        self.basket: Dict[str, int] = {}
+        self.coupon: Optional[str] = None
+
+    def _view(self, request_name: str = "Req_ViewBasket") -> BaseModel:
+        products = self.backend.data["products"]
+        items = [
+            {"sku": sku, "name": products[sku].get("name"), "quantity": qty, "price": products[sku].get("price") or 0.0}
+            for sku, qty in self.basket.items()
+        ]
+        subtotal = round(sum(i["price"] * i["quantity"] for i in items), 2)
+        discount = 0.0
+        if self.coupon:
+            rule = self.backend.data["coupons"][self.coupon]
+            if subtotal >= rule["min_total"]:
+                discount = round(subtotal * rule["percent"] / 100, 2)
+        return _items_response(request_name, items, store, subtotal=subtotal, coupon=self.coupon,
+                               discount=discount, total=round(subtotal - discount, 2))
+
+    def _basket_response(self, request_name: str) -> BaseModel:
+        """Basket writes answer with their own response model, or the basket view"""
+        model = response_model(request_name, store)
+        if list_field(model) is not None:
+            return self._view(request_name)
+        return build(model, {})
+
+    def dispatch(self, request: Any) -> Any:
+        name = type(request).__name__
+        self._call(name)
+        data = self.backend.data
+        with self.backend.lock:
+            if name == "Req_ListProducts":
+                return self._page(request, list(data["products"].values()))
+            if name == "Req_ViewBasket":
+                return self._view()
+            if name == "Req_ApplyCoupon":
+                code = _first(request, "coupon", "code")
+                if code not in data["coupons"]:
+                    raise api_error("invalid_coupon", f"coupon {code} does not exist")
+                self.coupon = code
+                return self._basket_response(name)
+            if name == "Req_RemoveCoupon":
+                self.coupon = None
+                return self._basket_response(name)
+            if name == "Req_AddProductToBasket":
+                sku = _first(request, "sku")
+                qty = getattr(request, "quantity", 1) or 1
+                if sku not in data["products"]:
+                    raise api_error("not_found", f"product {sku} not found")
+                if (data["products"][sku].get("available") or 0) < self.basket.get(sku, 0) + qty:
+                    raise api_error("out_of_stock", f"not enough {sku} in stock")
+                self.basket[sku] = self.basket.get(sku, 0) + qty
+                return self._basket_response(name)
+            if name == "Req_RemoveItemFromBasket":
+                sku = _first(request, "sku")
+                qty = getattr(request, "quantity", None) or self.basket.get(sku, 0)
+                left = self.basket.get(sku, 0) - qty
+                if left > 0:
+                    self.basket[sku] = left
+                else:
+                    self.basket.pop(sku, None)
+                return self._basket_response(name)
+            if name == "Req_CheckoutBasket":
+                if not self.basket:
+                    raise api_error("empty_basket", "basket is empty")
+                response = self._basket_response(name)
+                for sku, qty in self.basket.items():
+                    product = data["products"][sku]
+                    if "available" in product:
+                        product["available"] -= qty
+                self.basket.clear()
+                self.coupon = None
+                return response
+        raise api_error("unsupported", f"{name} is not implemented by the local backend")
+
+
+_TASK_TEMPLATES = [
+    "What is today's date?",
+    "Which projects is {employee} working on?",
+    "Show me the status of project {project}.",
+    "How many hours were logged on {project}?",
+    "Who is the account manager of {customer}?",
+    "What is the salary of {employee}?",
+    "Log 2 hours on {project} for yesterday: workshop.",
+    "List all employees in {department}.",
+]
+
+
+class LocalERC3:
+    """Stand-in for the ERC3 core: sessions, tasks and clients backed by memory
+
+    Drop-in for `ERC3()` in main.py (AGENT_BACKEND=local). Latency is
+    randomized around `latency_sec`; `error_rate` is the probability of an
+    injected API error per call.
+    """
+
+    def __init__(
+        self,
+        data: Optional[Dict[str, Any]] = None,
+        tasks: int = 20,
+        latency_sec: float = 0.0,
+        error_rate: float = 0.0,
+        page_size: int = 10,
+        guest_ratio: float = 0.2,
+        seed: int = 0,
+    ):
+        self.data = data if data is not None else generate_dataset(seed)
+        self.task_count = tasks
+        self.latency_sec = latency_sec
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.guest_ratio = guest_ratio
+        self.lock = threading.RLock()
+        self.responses: List[Dict[str, Any]] = []
+        self.counters: Dict[str, int] = {}
+        self._counter_lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._users: Dict[str, Optional[str]] = {}
+        self._session_tasks: List[Any] = []
+
+    @classmethod
+    def from_env(cls) -> "LocalERC3":
+        """Configure from LOCAL_* environment variables"""
+        sizes = {
+            "employees": int(os.getenv("LOCAL_EMPLOYEES", "50")),
+            "projects": int(os.getenv("LOCAL_PROJECTS", "20")),
+            "customers": int(os.getenv("LOCAL_CUSTOMERS", "15")),
+            "time_entries": int(os.getenv("LOCAL_TIME_ENTRIES", "500")),
+            "products": int(os.getenv("LOCAL_PRODUCTS", "200")),
+        }
+        seed = int(os.getenv("LOCAL_SEED", "0"))
+        return cls(
+            data=generate_dataset(seed, **sizes),
+            tasks=int(os.getenv("LOCAL_TASKS", "20")),
+            latency_sec=float(os.getenv("LOCAL_LATENCY_SEC", "0.05")),
+            error_rate=float(os.getenv("LOCAL_ERROR_RATE", "0")),
+            page_size=int(os.getenv("LOCAL_PAGE_SIZE", "10")),
+            seed=seed,
+        )
+
+    def random(self) -> float:
+        with self._counter_lock:
+            return self._random.random()
+
+    def count(self, name: str):
+        with self._counter_lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def wiki_sha1(self) -> str:
+        with self.lock:
+            raw = "\n".join(f"{p}\n{c}" for p, c in sorted(self.data["wiki"].items()))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    # -- session API ---------------------------------------------------------
+
+    def start_session(self, **kwargs):
+        rnd = random.Random(len(self._session_tasks))
+        emp_ids = list(self.data["employees"])
+        tasks = []
+        for i in range(self.task_count):
+            template = _TASK_TEMPLATES[i % len(_TASK_TEMPLATES)]
+            text = template.format(
+                employee=self.data["employees"][rnd.choice(emp_ids)].get("name", "someone") if emp_ids else "someone",
+                project=rnd.choice(list(self.data["projects"]) or ["none"]),
+                customer=rnd.choice(list(self.data["customers"]) or ["none"]),
+                department=rnd.choice(_DEPARTMENTS),
+            )
+            task_id = f"local-task-{i}"
+            self._users[task_id] = None if rnd.random() < self.guest_ratio or not emp_ids else rnd.choice(emp_ids)
+            tasks.append(SimpleNamespace(task_id=task_id, spec_id=f"local_{i % len(_TASK_TEMPLATES)}", task_text=text))
+        self._session_tasks = tasks
+        return SimpleNamespace(session_id="local-session")
+
+    def session_status(self, session_id: str):
+        return SimpleNamespace(session_id=session_id, tasks=list(self._session_tasks))
+
+    def start_task(self, task):
+        self.count("start_task")
+
+    def complete_task(self, task):
+        self.count("complete_task")
+        return SimpleNamespace(eval=None)
+
+    def submit_session(self, session_id: str):
+        self.count("submit_session")
+
+    def log_llm(self, **kwargs):
+        self.count("log_llm")
+
+    def get_erc_dev_client(self, task) -> LocalDevClient:
+        return LocalDevClient(self, self._users.get(task.task_id))
+
+    def get_store_client(self, task) -> LocalStoreClient:
+        return LocalStoreClient(self)
+
+
+# ---------------------------------------------------------------------------
+# Load test without an LLM: exercises wiki cache, dispatch cache and pagination
+# ---------------------------------------------------------------------------
+
+def _items(response: BaseModel) -> List[Any]:
+    field = list_field(type(response))
+    return getattr(response, field[0]) if field else []
+
+
+def _synthetic_agent(backend: LocalERC3, task) -> Dict[str, int]:
+    from dispatch_cache import CachingDispatcher
+    from pagination import drain_pages
+    from wiki_store import get_wiki_store
+
+    api = CachingDispatcher(backend.get_erc_dev_client(task))
+    about = api.who_am_i()
+    get_wiki_store().get_pages(api, version=about.wiki_sha1, log=lambda msg: None)
+    employees = drain_pages(api.dispatch, dev.Req_ListEmployees(offset=0, limit=backend.page_size))
+    projects = drain_pages(api.dispatch, dev.Req_ListProjects(offset=0, limit=backend.page_size))
+    # Typical agent behaviour: look up the same few entities more than once
+    for _ in range(2):
+        for emp in _items(employees)[:5]:
+            api.dispatch(dev.Req_GetEmployee(id=emp.id))
+        for proj in _items(projects)[:3]:
+            api.dispatch(dev.Req_GetProject(id=proj.id))
+    return api.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive many concurrent synthetic agents against the local backend. "
+                    "A small run (--tasks 5) doubles as a smoke test of the SDK shapes: "
+                    "it exits non-zero if a task fails or a record differs from the SDK models.")
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.02, help="mean API latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--projects", type=int, default=300)
+    parser.add_argument("--page-size", type=int, default=10)
+    args = parser.parse_args()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    backend = LocalERC3(
+        data=generate_dataset(0, employees=args.employees, projects=args.projects),
+        tasks=args.tasks,
+        latency_sec=args.latency,
+        error_rate=args.error_rate,
+        page_size=args.page_size,
+    )
+    backend.start_session()
+    tasks = backend.session_status("local-session").tasks
+
+    started = time.time()
+    failures: Dict[str, int] = {}
+    hits = misses = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for future in [pool.submit(_synthetic_agent, backend, t) for t in tasks]:
+            try:
+                stats = future.result()
+                hits += stats["hits"]
+                misses += stats["misses"]
+            except Exception as e:
+                if args.error_rate <= 0 or not isinstance(e, ApiException):
+                    key = f"{type(e).__name__}: {e}"
+                    failures[key] = failures.get(key, 0) + 1
+                else:
+                    failures["injected"] = failures.get("injected", 0) + 1
+    elapsed = time.time() - started
+    failed = sum(failures.values())
+
+    print(f"Tasks: {len(tasks)} ({failed} failed) in {elapsed:.2f}s -> {len(tasks) / elapsed:.1f} tasks/s")
+    print(f"Dispatch cache: {hits} hits, {misses} misses ({hits / max(1, hits + misses):.0%} hit rate)")
+    print(f"Pages served: {backend.counters.get('pages_served', 0)}, "
+          f"wiki page loads: {backend.counters.get('load_wiki_page', 0)}, "
+          f"errors injected: {backend.counters.get('errors_injected', 0)}")
+    for error, count in failures.items():
+        if error != "injected":
+            print(f"Failed x{count}: {error}")
+    drift = shape_drift()
+    for key, names in drift.items():
+        print(f"SDK shape: {key}: {', '.join(names)}")
+    unexpected = failed - failures.get("injected", 0)
+    if unexpected or drift:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
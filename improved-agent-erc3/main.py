@@ -1,7 +1,19 @@
+import argparse
+import asyncio
 import os
+import sys
 import textwrap
-from enhanced_agent import run_agent
+import traceback
+from types import SimpleNamespace
+from cassette import open_core
+from checkpoint import SessionCheckpoint
+from enhanced_agent import run_agent, run_agent_async
 from erc3 import ERC3
+from llm_cache import get_llm_cache
+from metrics import get_metrics
+from prefetch import session_stats as prefetch_stats
+from rate_limiter import get_scheduler
+from session_runner import run_tasks, run_tasks_async
 
 # Configuration
 # LLM Provider: "auto" (detect from env), "openai", or "google"
@@ -26,56 +38,198 @@ if MODEL_ID is None:
 else:
     effective_provider = LLM_PROVIDER
 
+# Number of tasks that run at the same time (network-bound, so threads are fine)
+parser = argparse.ArgumentParser(description="Run the enhanced agent over an erc3-dev session")
+parser.add_argument(
+    "--concurrency", type=int, default=int(os.getenv("MAX_CONCURRENCY", "4")),
+    help="maximum number of tasks in flight (default: $MAX_CONCURRENCY or 4)")
+parser.add_argument(
+    "--async", dest="use_async", action="store_true", default=os.getenv("AGENT_ASYNC") == "1",
+    help="drive all tasks from one event loop instead of a thread per task ($AGENT_ASYNC=1)")
+parser.add_argument(
+    "--resume", action="store_true",
+    help="continue the session in $AGENT_CHECKPOINT_DIR: skip completed tasks, "
+         "pick up started ones at their last step")
+args = parser.parse_args()
+MAX_CONCURRENCY = max(1, args.concurrency)
+USE_ASYNC = args.use_async
+if USE_ASYNC and os.getenv("AGENT_CASSETTE_MODE"):
+    print("--async is not supported with AGENT_CASSETTE_MODE; using threads")
+    USE_ASYNC = False
+
 print(f"🤖 LLM Configuration:")
 print(f"   Provider: {effective_provider}")
 print(f"   Model: {MODEL_ID}")
+print(f"   Concurrency: {MAX_CONCURRENCY} ({'event loop' if USE_ASYNC else 'threads'})")
 print()
 
-core = ERC3()
+# AGENT_BACKEND=local runs against the in-process stand-in backend (see local_backend.py)
+if os.getenv("AGENT_BACKEND") == "local":
+    from local_backend import LocalERC3
+    backend_factory = LocalERC3.from_env
+else:
+    backend_factory = ERC3
+
+# AGENT_CASSETTE_MODE=record|replay captures/serves all traffic (see cassette.py)
+core = open_core(backend_factory)
 
-# Start session with metadata
-res = core.start_session(
-    benchmark="erc3-dev",
-    workspace="my",
-    name=f"Enhanced SGR Agent v2.1 ({MODEL_ID}) - Multi-LLM",
-    architecture=f"Enhanced NextStep SGR with {effective_provider.upper()} ({MODEL_ID}), Wiki integration, security checks")
+# Runner state is checkpointed after every step so --resume can continue
+checkpoint = SessionCheckpoint()
+if args.resume and checkpoint.session_id:
+    session_id = checkpoint.session_id
+    print(f"Resuming session: {session_id}")
+else:
+    if args.resume:
+        print("No checkpoint to resume; starting a new session")
+    # Start session with metadata
+    res = core.start_session(
+        benchmark="erc3-dev",
+        workspace="my",
+        name=f"Enhanced SGR Agent v2.1 ({MODEL_ID}) - Multi-LLM",
+        architecture=f"Enhanced NextStep SGR with {effective_provider.upper()} ({MODEL_ID}), Wiki integration, security checks")
+    session_id = res.session_id
+    checkpoint.start(session_id)
 
-status = core.session_status(res.session_id)
+status = core.session_status(session_id)
 print(f"\n{'='*60}")
-print(f"Session started: {res.session_id}")
+print(f"Session started: {session_id}")
 print(f"Total tasks: {len(status.tasks)}")
 print(f"{'='*60}\n")
 
-for idx, task in enumerate(status.tasks, 1):
+total_tasks = len(status.tasks)
+
+
+def print_task_header(idx, task):
     print("\n" + "="*60)
-    print(f"TASK {idx}/{len(status.tasks)}: {task.spec_id}")
+    print(f"TASK {idx}/{total_tasks}: {task.spec_id}")
     print(f"ID: {task.task_id}")
     print(f"Text: {task.task_text}")
     print("="*60)
-    
-    # Start the task
-    core.start_task(task)
-    
-    try:
-        run_agent(MODEL_ID, core, task, llm_provider=LLM_PROVIDER)
-    except Exception as e:
-        print(f"\n❌ EXCEPTION: {e}")
-        import traceback
-        traceback.print_exc()
-    
-    # Complete and get result
-    result = core.complete_task(task)
-    
+
+
+def print_task_result(idx, result):
     if result.eval:
         explain = textwrap.indent(result.eval.logs, "  ")
         score_color = "🟢" if result.eval.score == 1.0 else "🔴" if result.eval.score == 0 else "🟡"
         print(f"\n{score_color} SCORE: {result.eval.score}")
         print(f"EVALUATION:\n{explain}\n")
     
-    print(f"Completed {idx}/{len(status.tasks)} tasks\n")
+    print(f"Finished task {idx}/{total_tasks}\n")
+
+
+def completed_result(idx, task):
+    """Result of a task completed before the run was resumed"""
+    saved = checkpoint.result(task.task_id)
+    print(f"Task {idx}/{total_tasks} {task.spec_id} already completed, skipping")
+    if saved.get("score") is None:
+        return SimpleNamespace(eval=None)
+    return SimpleNamespace(eval=SimpleNamespace(score=saved["score"], logs=saved.get("logs") or ""))
+
+
+def save_result(task, result):
+    evaluation = getattr(result, "eval", None)
+    checkpoint.mark_completed(
+        task.task_id,
+        score=evaluation.score if evaluation else None,
+        logs=evaluation.logs if evaluation else None,
+    )
+
+
+def process_task(idx, task):
+    if checkpoint.status(task.task_id) == "completed":
+        return completed_result(idx, task)
+    print_task_header(idx, task)
+    
+    # Start the task (a resumed one was started by the previous run)
+    task_checkpoint = checkpoint.task(task.task_id)
+    if checkpoint.status(task.task_id) == "started":
+        print("Continuing task from its checkpoint")
+    else:
+        core.start_task(task)
+        checkpoint.mark_started(task.task_id)
+    
+    # An answer sent before the interruption must not be sent again
+    if task_checkpoint.responded():
+        print("Task was already answered; completing it")
+    else:
+        try:
+            run_agent(MODEL_ID, core, task, llm_provider=LLM_PROVIDER, checkpoint=task_checkpoint)
+        except Exception as e:
+            print(f"\n❌ EXCEPTION: {e}")
+            traceback.print_exc(file=sys.stdout)
+    
+    # Complete and get result
+    result = core.complete_task(task)
+    save_result(task, result)
+    print_task_result(idx, result)
+    return result
+
+
+async def process_task_async(idx, task):
+    if checkpoint.status(task.task_id) == "completed":
+        return completed_result(idx, task)
+    print_task_header(idx, task)
+    task_checkpoint = checkpoint.task(task.task_id)
+    if checkpoint.status(task.task_id) == "started":
+        print("Continuing task from its checkpoint")
+    else:
+        await asyncio.to_thread(core.start_task, task)
+        checkpoint.mark_started(task.task_id)
+
+    if task_checkpoint.responded():
+        print("Task was already answered; completing it")
+    else:
+        try:
+            await run_agent_async(MODEL_ID, core, task, llm_provider=LLM_PROVIDER, checkpoint=task_checkpoint)
+        except Exception as e:
+            print(f"\n❌ EXCEPTION: {e}")
+            traceback.print_exc(file=sys.stdout)
+
+    result = await asyncio.to_thread(core.complete_task, task)
+    save_result(task, result)
+    print_task_result(idx, result)
+    return result
+
+
+# Every worker has finished once run_tasks returns
+if USE_ASYNC:
+    results = run_tasks_async(status.tasks, process_task_async, max_concurrency=MAX_CONCURRENCY)
+else:
+    results = run_tasks(status.tasks, process_task, max_workers=MAX_CONCURRENCY)
+
+# Ordered score summary
+print("\n" + "="*60)
+print("SCORES")
+print("="*60)
+total_score = 0.0
+for idx, (task, result) in enumerate(zip(status.tasks, results), 1):
+    if result is None:
+        print(f"{idx:>3}. {task.spec_id:<30} ❌ failed to complete")
+    elif result.eval:
+        total_score += result.eval.score
+        print(f"{idx:>3}. {task.spec_id:<30} {result.eval.score}")
+    else:
+        print(f"{idx:>3}. {task.spec_id:<30} (no evaluation)")
+print(f"\nTotal: {total_score}/{total_tasks}")
+
+# Where the session's time went (per-step records: $AGENT_METRICS_FILE)
+print("\n" + "="*60)
+print("TIMINGS")
+print("="*60)
+get_metrics().print_summary()
+llm_stats = get_scheduler().stats()
+print(f"LLM calls: {llm_stats['admitted']} admitted, {llm_stats['waited_sec']}s waiting for quota, "
+      f"{llm_stats['retries']} retries ({llm_stats['rate_limited']} rate limited)")
+prefetch = prefetch_stats()
+if prefetch["prefetches"]:
+    print(f"Prefetch: {prefetch['hits']} of {prefetch['prefetches']} prefetched reads used "
+          f"(hit rate {prefetch['hit_rate']})")
+if get_llm_cache() is not None:
+    cache_stats = get_llm_cache().stats()
+    print(f"LLM response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
 
 # Submit session
-core.submit_session(res.session_id)
+core.submit_session(session_id)
 
 print("\n" + "="*60)
 print("SESSION COMPLETE!")
@@ -0,0 +1,161 @@
+"""
+Per-step latency and token instrumentation for the agent loop
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class MetricsRecorder:
+    """Collects step records from all tasks of a session
+
+    Each finished record is appended to a JSONL file (if configured) and kept
+    in memory for the end-of-session summary. Safe to use from several task
+    threads at once.
+
+    A step record looks like:
+        {"task_id", "step", "kind": "step", "started", "step_sec", "llm_sec",
+         "prompt_tokens", "completion_tokens", "cached_tokens", "client_sec",
+         "first_token_sec", "early_dispatch", "cache_hit", "tier", "escalation",
+         "tiers": [{"tier", "model", "sec", "prompt_tokens", "completion_tokens", "cached_tokens"}],
+         "serialize_sec", "prefetched",
+         "dispatch": [{"request", "sec", "bytes", "raw_bytes", "ok"}], "error"}
+    Setup of a task (identity, wiki, prompt) is recorded with kind "setup";
+    its "fast_path" names the rule when the task was answered without the LLM.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: JSONL file to append records to (None = memory only)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: List[Dict[str, Any]] = []
+
+    def start_step(self, task_id: str, step: int, kind: str = "step") -> Dict[str, Any]:
+        """Open a record; fill it in and pass it to finish_step"""
+        return {
+            "task_id": task_id,
+            "step": step,
+            "kind": kind,
+            "started": time.time(),
+            "dispatch": [],
+            "error": False,
+        }
+
+    def finish_step(self, record: Dict[str, Any]):
+        """Close a record and persist it"""
+        record["step_sec"] = round(time.time() - record["started"], 4)
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._records.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+    def records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self, slowest: int = 5) -> Dict[str, Any]:
+        """Aggregate p50/p95 by stage, tokens per task and the slowest tasks"""
+        stages: Dict[str, List[float]] = {}
+        tokens: Dict[str, Dict[str, int]] = {}
+        tiers: Dict[str, Dict[str, Any]] = {}
+        task_time: Dict[str, float] = {}
+        errors = 0
+
+        def add(stage: str, value: Optional[float]):
+            if value is not None:
+                stages.setdefault(stage, []).append(value)
+
+        for rec in self.records():
+            task_id = rec["task_id"]
+            task_time[task_id] = task_time.get(task_id, 0.0) + rec.get("step_sec", 0.0)
+            if rec["kind"] == "setup":
+                add("setup", rec.get("step_sec"))
+                continue
+            errors += int(bool(rec.get("error")))
+            add("step", rec.get("step_sec"))
+            add("llm", rec.get("llm_sec"))
+            add("first_token", rec.get("first_token_sec"))
+            add("client", rec.get("client_sec"))
+            add("serialize", rec.get("serialize_sec"))
+            for call in rec.get("dispatch", []):
+                add(f"dispatch:{call['request']}", call.get("sec"))
+                add("result_bytes", call.get("bytes"))
+                add("result_raw_bytes", call.get("raw_bytes"))
+            for call in rec.get("tiers") or []:
+                add(f"llm:{call['tier']}", call.get("sec"))
+                tier = tiers.setdefault(call["tier"], {
+                    "model": call.get("model"), "calls": 0, "answers": 0, "prompt": 0, "completion": 0})
+                tier["calls"] += 1
+                tier["prompt"] += call.get("prompt_tokens") or 0
+                tier["completion"] += call.get("completion_tokens") or 0
+            if rec.get("tier") in tiers:
+                tiers[rec["tier"]]["answers"] += 1
+            usage = tokens.setdefault(task_id, {"prompt": 0, "completion": 0, "cached": 0})
+            usage["prompt"] += rec.get("prompt_tokens") or 0
+            usage["completion"] += rec.get("completion_tokens") or 0
+            usage["cached"] += rec.get("cached_tokens") or 0
+
+        return {
+            "stages": {
+                name: {
+                    "count": len(values),
+                    "p50": round(percentile(values, 50), 4),
+                    "p95": round(percentile(values, 95), 4),
+                    "total": round(sum(values), 4),
+                }
+                for name, values in sorted(stages.items())
+            },
+            "tokens_per_task": tokens,
+            "tiers": tiers,
+            "slowest_tasks": sorted(task_time.items(), key=lambda item: -item[1])[:slowest],
+            "error_steps": errors,
+        }
+
+    def print_summary(self):
+        """Print the session aggregate as a table"""
+        summary = self.summary()
+        print(f"\n{'stage':<40} {'count':>6} {'p50':>9} {'p95':>9} {'total':>10}")
+        for name, row in summary["stages"].items():
+            print(f"{name:<40} {row['count']:>6} {row['p50']:>9} {row['p95']:>9} {row['total']:>10}")
+        if summary["tokens_per_task"]:
+            prompt = [t["prompt"] for t in summary["tokens_per_task"].values()]
+            completion = [t["completion"] for t in summary["tokens_per_task"].values()]
+            print(f"\nTokens per task: prompt p50={percentile(prompt, 50)} p95={percentile(prompt, 95)}, "
+                  f"completion p50={percentile(completion, 50)} p95={percentile(completion, 95)}")
+        for name, tier in summary["tiers"].items():
+            print(f"Tier {name} ({tier['model']}): {tier['calls']} calls, {tier['answers']} answers used, "
+                  f"{tier['prompt']} prompt / {tier['completion']} completion tokens")
+        print(f"Steps ending in error: {summary['error_steps']}")
+        print("Slowest tasks:")
+        for task_id, seconds in summary["slowest_tasks"]:
+            print(f"  {task_id}: {seconds:.1f}s")
+
+
+# One recorder per process, shared by all tasks of a session
+_default_recorder: Optional[MetricsRecorder] = None
+_default_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRecorder:
+    """Return the process-wide recorder (JSONL path from AGENT_METRICS_FILE)"""
+    global _default_recorder
+    with _default_lock:
+        if _default_recorder is None:
+            _default_recorder = MetricsRecorder(os.getenv("AGENT_METRICS_FILE") or None)
+        return _default_recorder
@@ -0,0 +1,179 @@
+"""
+Fast-model-first cascade for structured LLM calls
+"""
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+
+# Cheap model that handles steps first (unset = no cascade)
+FAST_MODEL_ID = os.getenv("FAST_MODEL_ID", "")
+
+# Steps whose function name starts with one of these always go to the strong model
+CASCADE_STRONG_FUNCTIONS = tuple(
+    p.strip() for p in os.getenv(
+        "CASCADE_STRONG_FUNCTIONS", "Req_Update,Req_LogTimeEntry,Req_ProvideAgentResponse").split(",")
+    if p.strip()
+)
+# ...and so does every answer with one of these outcomes (access decisions)
+CASCADE_ESCALATE_OUTCOMES = ("denied_security",)
+# Opt-in: also escalate when the free-text security_check contains one of these.
+# It is written on every step and often negates them ("not denied"), so none by default
+CASCADE_ESCALATE_KEYWORDS = tuple(
+    k.strip().lower() for k in os.getenv("CASCADE_ESCALATE_KEYWORDS", "").split(",")
+    if k.strip()
+)
+
+
+def escalation_reason(parsed: Optional[BaseModel]) -> Optional[str]:
+    """Why a fast-model answer should be redone by the strong model (None = keep it)"""
+    if parsed is None:
+        return "no parsed response"
+    function = getattr(parsed, "function", None)
+    if function is not None and type(function).__name__.startswith(CASCADE_STRONG_FUNCTIONS):
+        return f"risky step {type(function).__name__}"
+    outcome = getattr(function, "outcome", None)
+    if outcome in CASCADE_ESCALATE_OUTCOMES:
+        return f"outcome {outcome}"
+    security = str(getattr(parsed, "security_check", "") or "").lower()
+    for keyword in CASCADE_ESCALATE_KEYWORDS:
+        if keyword in security:
+            return f"security check mentions '{keyword}'"
+    return None
+
+
+class CascadeLLMClient:
+    """LLMClient stand-in that tries a fast model before the strong one
+
+    The fast model's answer is used unless it fails to parse/validate or
+    `escalate(parsed)` returns a reason; then the strong model answers the
+    same messages. The usage dict describes the answer that was used and
+    lists every tier's call under "tiers".
+    """
+
+    def __init__(self, fast, strong, escalate: Callable[[Optional[BaseModel]], Optional[str]] = escalation_reason):
+        """
+        Args:
+            fast: LLMClient for the cheap model
+            strong: LLMClient for the strong model
+            escalate: Returns a reason to redo an answer with the strong model
+        """
+        self.fast = fast
+        self.strong = strong
+        self.escalate = escalate
+        self.last_client = strong
+
+    def build_messages(self, static_prompt: str, context_prompt: str, user_text: str) -> List[Dict[str, Any]]:
+        return self.strong.build_messages(static_prompt, context_prompt, user_text)
+
+    def _tier_usage(self, tier: str, client, started: float, usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        usage = usage or {}
+        return {
+            "tier": tier,
+            "model": client.get_model_name(),
+            "sec": round(time.time() - started, 4),
+            "prompt_tokens": usage.get("prompt_tokens") or 0,
+            "completion_tokens": usage.get("completion_tokens") or 0,
+            "cached_tokens": usage.get("cached_tokens") or 0,
+        }
+
+    def _fast_outcome(self, result: Optional[Tuple[BaseModel, Dict[str, Any]]], error: Optional[Exception]) -> Optional[str]:
+        if error is not None:
+            return f"fast model failed: {type(error).__name__}"
+        return self.escalate(result[0])
+
+    def _combine(self, tiers: List[Dict[str, Any]], usage: Dict[str, Any], reason: Optional[str]) -> Dict[str, Any]:
+        usage = dict(usage)
+        # Totals cover every call made for this step
+        usage["prompt_tokens"] = sum(t["prompt_tokens"] for t in tiers)
+        usage["completion_tokens"] = sum(t["completion_tokens"] for t in tiers)
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        usage["cached_tokens"] = sum(t["cached_tokens"] for t in tiers)
+        usage["tier"] = tiers[-1]["tier"]
+        usage["escalation"] = reason
+        usage["tiers"] = tiers
+        return usage
+
+    def parse_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        response_format: type[BaseModel],
+        max_tokens: int = 16384,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> Tuple[BaseModel, Dict[str, Any]]:
+        tiers = []
+        started = time.time()
+        result, error = None, None
+        try:
+            # Early-dispatched reads of a discarded fast answer are harmless
+            result = self.fast.parse_completion(messages, response_format, max_tokens, on_field)
+        except Exception as e:
+            error = e
+        tiers.append(self._tier_usage("fast", self.fast, started, result[1] if result else None))
+        reason = self._fast_outcome(result, error)
+        if reason is None:
+            self.last_client = self.fast
+            return result[0], self._combine(tiers, result[1], None)
+
+        started = time.time()
+        parsed, usage = self.strong.parse_completion(messages, response_format, max_tokens, on_field)
+        tiers.append(self._tier_usage("strong", self.strong, started, usage))
+        self.last_client = self.strong
+        return parsed, self._combine(tiers, usage, reason)
+
+    def get_model_name(self) -> str:
+        """Model that produced the last answer"""
+        return self.last_client.get_model_name()
+
+    def get_provider_name(self) -> str:
+        return self.strong.get_provider_name()
+
+
+class AsyncCascadeLLMClient(CascadeLLMClient):
+    """CascadeLLMClient over AsyncLLMClient tiers"""
+
+    async def parse_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        response_format: type[BaseModel],
+        max_tokens: int = 16384,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> Tuple[BaseModel, Dict[str, Any]]:
+        tiers = []
+        started = time.time()
+        result, error = None, None
+        try:
+            result = await self.fast.parse_completion(messages, response_format, max_tokens, on_field)
+        except Exception as e:
+            error = e
+        tiers.append(self._tier_usage("fast", self.fast, started, result[1] if result else None))
+        reason = self._fast_outcome(result, error)
+        if reason is None:
+            self.last_client = self.fast
+            return result[0], self._combine(tiers, result[1], None)
+
+        started = time.time()
+        parsed, usage = await self.strong.parse_completion(messages, response_format, max_tokens, on_field)
+        tiers.append(self._tier_usage("strong", self.strong, started, usage))
+        self.last_client = self.strong
+        return parsed, self._combine(tiers, usage, reason)
+
+
+def make_cascade_client(client_cls, provider: str, model: Optional[str], task_key: Optional[str] = None):
+    """
+    Build the LLM client for a task: a cascade if FAST_MODEL_ID is set
+
+    Args:
+        client_cls: LLMClient or AsyncLLMClient
+        provider: Provider of both tiers
+        model: Strong model
+        task_key: Task the client works for (rate limiting)
+    """
+    strong = client_cls(provider=provider, model=model, task_key=task_key)
+    if not FAST_MODEL_ID or FAST_MODEL_ID == strong.get_model_name():
+        return strong
+    fast = client_cls(provider=strong.get_provider_name(), model=FAST_MODEL_ID, task_key=task_key)
+    from llm_client import AsyncLLMClient
+    cascade_cls = AsyncCascadeLLMClient if issubclass(client_cls, AsyncLLMClient) else CascadeLLMClient
+    return cascade_cls(fast, strong)
@@ -0,0 +1,74 @@
+"""
+Automatic draining of paged List*/Search* results
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+def is_paged_request(request: Any) -> bool:
+    """True for requests that take an offset (List*/Search* endpoints)"""
+    return "offset" in type(request).model_fields
+
+
+def _list_field(response: Any) -> Optional[str]:
+    """Name of the field holding the page items"""
+    for name in type(response).model_fields:
+        if isinstance(getattr(response, name), list):
+            return name
+    return None
+
+
+def _has_more(next_offset: Optional[int]) -> bool:
+    return next_offset is not None and next_offset > 0
+
+
+def drain_pages(
+    dispatch: Callable[[Any], Any],
+    request: Any,
+    max_items: int = 500,
+    max_workers: int = 4,
+) -> Any:
+    """
+    Fetch every page of a List*/Search* request and merge them into one response
+
+    The first page is fetched alone to learn the page size; after that
+    `max_workers` pages are requested concurrently at a time until a page
+    reports no further offset or `max_items` items were collected.
+
+    Args:
+        dispatch: Function executing one request (e.g. CachingDispatcher.dispatch)
+        request: First-page request; its `offset` is the starting point
+        max_items: Cap on the number of merged items
+        max_workers: Pages fetched in parallel
+
+    Returns:
+        A response of the first page's type with all items; `next_offset`
+        points past the last returned item if the cap was hit.
+    """
+    first = dispatch(request)
+    field = _list_field(first)
+    next_offset = getattr(first, "next_offset", None)
+    if field is None or not _has_more(next_offset):
+        return first
+
+    items = list(getattr(first, field))
+    page_size = len(items)
+    if page_size == 0:
+        return first
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="page") as pool:
+        while _has_more(next_offset) and len(items) < max_items:
+            offsets = [next_offset + k * page_size for k in range(max_workers)]
+            pages = pool.map(lambda off: dispatch(request.model_copy(update={"offset": off})), offsets)
+            for page in pages:
+                page_items = getattr(page, field)
+                items.extend(page_items)
+                next_offset = getattr(page, "next_offset", None)
+                # Pages past the end of a speculative batch are ignored
+                if not page_items or not _has_more(next_offset):
+                    break
+
+    if len(items) > max_items:
+        next_offset = (getattr(request, "offset", 0) or 0) + max_items
+        items = items[:max_items]
+    return first.model_copy(update={field: items, "next_offset": next_offset})
@@ -0,0 +1,177 @@
+"""
+Speculative prefetch of entities the next step is likely to read
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, ValidationError
+from erc3 import erc3 as dev
+
+
+# Set AGENT_PREFETCH=0 to disable
+PREFETCH_ENABLED = os.getenv("AGENT_PREFETCH", "1") != "0"
+# Reads started per LLM call, and threads serving them
+PREFETCH_PER_STEP = int(os.getenv("PREFETCH_PER_STEP", "6"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "3"))
+# Entities of a List*/Search* page are prefetched only from pages this small
+PREFETCH_LIST_MAX = int(os.getenv("PREFETCH_LIST_MAX", "5"))
+
+# Result fields that hold the id of another entity, and the read that loads it
+REFERENCE_FIELDS = {
+    "employee": dev.Req_GetEmployee,
+    "lead": dev.Req_GetEmployee,
+    "manager": dev.Req_GetEmployee,
+    "account_manager": dev.Req_GetEmployee,
+    "customer": dev.Req_GetCustomer,
+    "project": dev.Req_GetProject,
+}
+# List fields of paged results and the read that loads one of their items
+LISTED_ENTITIES = {
+    "employees": dev.Req_GetEmployee,
+    "customers": dev.Req_GetCustomer,
+    "projects": dev.Req_GetProject,
+}
+
+
+# Prefetches and prefetch hits of all closed tasks of the session
+_totals = {"prefetches": 0, "hits": 0}
+_totals_lock = threading.Lock()
+
+
+class Prefetcher:
+    """Warms a task's CachingDispatcher while the LLM is thinking
+
+    Results the agent reads are scanned for ids of other entities (project
+    customers, team members, account managers, items of short search
+    results). Before each LLM call `start()` fetches up to `per_step` of them
+    on a small background pool, so a follow-up Req_Get* is a cache hit. The
+    dispatcher counts prefetches and the ones that were used.
+
+    Ids a request model rejects are counted in `invalid`; anything else that
+    goes wrong building or scanning (e.g. a field name the SDK doesn't know)
+    is kept in `problems` for the task summary.
+    """
+
+    def __init__(self, dispatcher, per_step: int = PREFETCH_PER_STEP, workers: int = PREFETCH_WORKERS):
+        """
+        Args:
+            dispatcher: CachingDispatcher of the task
+            per_step: Reads started per start() call
+            workers: Background threads
+        """
+        self.dispatcher = dispatcher
+        self.per_step = per_step
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        # Referenced ids first: they are more likely to be read next than list items
+        self._references: List[BaseModel] = []
+        self._listed: List[BaseModel] = []
+        self._seen: set = set()
+        self.invalid = 0
+        self.problems: List[str] = []
+        dispatcher.listeners.append(self.observe)
+
+    def _problem(self, message: str):
+        with self._lock:
+            if message not in self.problems:
+                self.problems.append(message)
+
+    def _build(self, request_cls, **fields) -> Optional[BaseModel]:
+        try:
+            return request_cls(**fields)
+        except ValidationError:
+            with self._lock:
+                self.invalid += 1
+            return None
+        except Exception as e:
+            self._problem(f"{getattr(request_cls, '__name__', request_cls)}: {type(e).__name__}: {e}")
+            return None
+
+    def _queue(self, queue: List[BaseModel], request: Optional[BaseModel]):
+        if request is None:
+            return
+        key = (type(request).__name__, request.model_dump_json())
+        with self._lock:
+            if key not in self._seen:
+                self._seen.add(key)
+                queue.append(request)
+
+    def seed(self, about: Any):
+        """Queue what most tasks of a signed-in user read: their projects"""
+        user = getattr(about, "current_user", None)
+        if not user:
+            return
+        team_filter = getattr(dev, "ProjectTeamFilter", None)
+        if team_filter is None:
+            self._problem("erc3 has no ProjectTeamFilter; the user's projects are not prefetched")
+            return
+        team = self._build(team_filter, employee_id=user)
+        if team is not None:
+            self._queue(self._references, self._build(dev.Req_SearchProjects, team=team, limit=10, offset=0))
+
+    def observe(self, request: Any, result: Any):
+        """Queue entities referenced by a read result (dispatcher listener)"""
+        try:
+            data = result.model_dump() if isinstance(result, BaseModel) else result
+            self._walk(data)
+        except Exception as e:
+            # Never break the read that fed it, but don't hide the failure
+            self._problem(f"scanning {type(request).__name__}: {type(e).__name__}: {e}")
+
+    def _walk(self, value: Any):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if isinstance(item, str) and key in REFERENCE_FIELDS:
+                    self._queue(self._references, self._build(REFERENCE_FIELDS[key], id=item))
+                elif isinstance(item, list) and key in LISTED_ENTITIES and len(item) <= PREFETCH_LIST_MAX:
+                    for entity in item:
+                        if isinstance(entity, dict) and isinstance(entity.get("id"), str):
+                            self._queue(self._listed, self._build(LISTED_ENTITIES[key], id=entity["id"]))
+                self._walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                self._walk(item)
+
+    def start(self) -> int:
+        """Start prefetching queued reads in the background; returns how many"""
+        with self._lock:
+            batch = []
+            while len(batch) < self.per_step and (self._references or self._listed):
+                batch.append((self._references or self._listed).pop(0))
+        for request in batch:
+            self._pool.submit(self.dispatcher.prefetch, request)
+        return len(batch)
+
+    def close(self):
+        """Cancel queued reads, wait for running ones, add the counts to the session totals
+
+        Call before the task is completed so no speculative read outlives it.
+        """
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        if self.observe in self.dispatcher.listeners:
+            self.dispatcher.listeners.remove(self.observe)
+        stats = self.dispatcher.stats()
+        with _totals_lock:
+            _totals["prefetches"] += stats["prefetches"]
+            _totals["hits"] += stats["prefetch_hits"]
+
+
+def make_prefetcher(dispatcher, about: Any) -> Optional[Prefetcher]:
+    """Prefetcher for a task, or None when AGENT_PREFETCH=0"""
+    if not PREFETCH_ENABLED:
+        return None
+    prefetcher = Prefetcher(dispatcher)
+    prefetcher.seed(about)
+    return prefetcher
+
+
+def session_stats() -> Dict[str, Any]:
+    """Prefetches of the session so far and how many of them were used"""
+    with _totals_lock:
+        prefetches, hits = _totals["prefetches"], _totals["hits"]
+    return {
+        "prefetches": prefetches,
+        "hits": hits,
+        "hit_rate": round(hits / prefetches, 3) if prefetches else 0.0,
+    }
@@ -0,0 +1,350 @@
+"""
+Process-wide rate limiting and retries for LLM calls
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from tokens import estimate_tokens
+
+
+# Provider quota shared by all tasks of the process (0 = unlimited)
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+# Tokens reserved for the completion until the real usage is known
+LLM_COMPLETION_RESERVE = int(os.getenv("LLM_COMPLETION_RESERVE", "1024"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+
+_RETRYABLE_STATUS = (408, 409, 429)
+_RETRYABLE_NAMES = (
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "TooManyRequests", "ServerError",
+)
+
+
+class TokenBucket:
+    """Per-minute quota refilled continuously
+
+    A request larger than the whole bucket is admitted once the bucket is
+    full and leaves it in debt, so oversized prompts are slowed, not stuck.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 = now)"""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def give_back(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+def status_code(error: Exception) -> Optional[int]:
+    """HTTP status of an OpenAI / Google API error, if any"""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Server-requested delay (Retry-After / retry-after-ms headers) in seconds"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        # HTTP-date form: fall back to backoff
+        pass
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, timeouts, connection problems and 5xx are worth retrying"""
+    code = status_code(error)
+    if code is not None and (code in _RETRYABLE_STATUS or 500 <= code < 600):
+        return True
+    return type(error).__name__ in _RETRYABLE_NAMES or isinstance(error, (TimeoutError, ConnectionError))
+
+
+class LLMScheduler:
+    """Admits LLM calls within RPM/TPM quotas, fairly across tasks, and retries failures
+
+    Waiting calls are queued per task and admitted round-robin over tasks,
+    so one task with many retries can't starve the others. A Retry-After
+    from the provider pauses admission for everybody, as the quota is
+    shared. Threads wait on a condition; coroutines (call_async) wait on an
+    asyncio.Event of their loop, so a quota wait never holds an executor
+    thread.
+    """
+
+    def __init__(
+        self,
+        rpm: int = 0,
+        tpm: int = 0,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        """
+        Args:
+            rpm: Requests per minute (0 = unlimited)
+            tpm: Tokens per minute (0 = unlimited)
+            max_retries: Retries of one call before its error is raised
+            backoff_base: First backoff delay in seconds (doubles per attempt)
+            backoff_max: Cap on a single backoff delay
+        """
+        self.rpm = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm = TokenBucket(tpm) if tpm > 0 else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[object]] = {}
+        self._order: Deque[str] = deque()
+        self._async_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._paused_until = 0.0
+        self.admitted = 0
+        self.waited_sec = 0.0
+        self.retries = 0
+        self.rate_limited = 0
+
+    # -- admission -----------------------------------------------------------
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        wait = max(0.0, self._paused_until - now)
+        if self.rpm is not None:
+            wait = max(wait, self.rpm.wait_time(1, now))
+        if self.tpm is not None:
+            wait = max(wait, self.tpm.wait_time(tokens, now))
+        return wait
+
+    def _enqueue(self, task_key: str, ticket: object):
+        self._queues.setdefault(task_key, deque()).append(ticket)
+        if task_key not in self._order:
+            self._order.append(task_key)
+
+    def _admission_wait(self, task_key: str, ticket: object, tokens: float) -> Optional[float]:
+        """0 if the ticket may start now, seconds to wait if it is next, None if not its turn"""
+        if self._queues[self._order[0]][0] is not ticket:
+            return None
+        return self._wait_time(tokens, time.monotonic())
+
+    def _admit(self, task_key: str, ticket: object, tokens: float, started: float):
+        """Charge the quota and pass the turn to the next task"""
+        if self.rpm is not None:
+            self.rpm.take(1)
+        if self.tpm is not None:
+            self.tpm.take(tokens)
+        self._dequeue(task_key, ticket)
+        self.admitted += 1
+        self.waited_sec += time.monotonic() - started
+
+    def acquire(self, task_key: str, tokens: float):
+        """Block until a call of about `tokens` tokens may start"""
+        started = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._enqueue(task_key, ticket)
+            try:
+                while True:
+                    wait = self._admission_wait(task_key, ticket, tokens)
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cond.wait(wait)
+            except BaseException:
+                # Interrupted while queued: give up the place in line
+                self._dequeue(task_key, ticket)
+                raise
+            self._admit(task_key, ticket, tokens, started)
+
+    async def acquire_async(self, task_key: str, tokens: float):
+        """acquire for coroutines: waits on the event loop, not in a thread"""
+        started = time.monotonic()
+        ticket = object()
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        wake = waiter[1]
+        with self._cond:
+            self._enqueue(task_key, ticket)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    # Cleared under the lock: a notify after this point sets it again
+                    wake.clear()
+                    wait = self._admission_wait(task_key, ticket, tokens)
+                    if wait is not None and wait <= 0:
+                        self._admit(task_key, ticket, tokens, started)
+                        return
+                try:
+                    await asyncio.wait_for(wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                if ticket in self._queues.get(task_key, ()):
+                    self._dequeue(task_key, ticket)
+            raise
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+    def _notify(self):
+        """Wake every waiter, threads and coroutines (call with the lock held)"""
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Loop already closed
+                pass
+
+    def _dequeue(self, task_key: str, ticket: object):
+        """Remove a ticket; the task moves to the back of the round-robin order"""
+        queue = self._queues[task_key]
+        queue.remove(ticket)
+        self._order.remove(task_key)
+        if queue:
+            self._order.append(task_key)
+        else:
+            del self._queues[task_key]
+        self._notify()
+
+    def settle(self, reserved: float, actual: Optional[float]):
+        """Correct the token charge once the real usage is known"""
+        if self.tpm is None or not actual:
+            return
+        with self._cond:
+            if actual > reserved:
+                self.tpm.take(actual - reserved)
+            else:
+                self.tpm.give_back(reserved - actual)
+            self._notify()
+
+    def pause(self, seconds: float):
+        """Hold back all calls for `seconds` (provider asked us to)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._notify()
+
+    # -- retries -------------------------------------------------------------
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Delay before the next attempt, or None if the error should be raised"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        # Full jitter keeps tasks that failed together from retrying together
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, requested)
+        with self._cond:
+            if status_code(error) == 429 or type(error).__name__ in ("RateLimitError", "ResourceExhausted"):
+                self.rate_limited += 1
+                self.pause(delay)
+            self.retries += 1
+        return delay
+
+    def call(self, task_key: str, tokens: float, fn: Callable[[], Any], usage_tokens: Callable[[Any], Optional[float]]):
+        """
+        Run fn() within the quota, retrying transient failures
+
+        Args:
+            task_key: Task the call belongs to (fair queueing)
+            tokens: Estimated tokens of the call
+            fn: The call
+            usage_tokens: Extracts the real token count from fn's result
+        """
+        attempt = 0
+        while True:
+            self.acquire(task_key, tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self.settle(tokens, usage_tokens(result))
+            return result
+
+    async def call_async(
+        self,
+        task_key: str,
+        tokens: float,
+        fn: Callable[[], Awaitable[Any]],
+        usage_tokens: Callable[[Any], Optional[float]],
+    ):
+        """Async counterpart of call; quota waits are awaited on the loop"""
+        attempt = 0
+        while True:
+            await self.acquire_async(task_key, tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.settle(tokens, usage_tokens(result))
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "waited_sec": round(self.waited_sec, 2),
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+
+
+# One scheduler per process: every task shares the same API key
+_default_scheduler: Optional[LLMScheduler] = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler (limits from LLM_RPM / LLM_TPM / LLM_MAX_RETRIES)"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = LLMScheduler(
+                rpm=LLM_RPM,
+                tpm=LLM_TPM,
+                max_retries=LLM_MAX_RETRIES,
+                backoff_base=LLM_BACKOFF_BASE,
+                backoff_max=LLM_BACKOFF_MAX,
+            )
+        return _default_scheduler
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Prompt tokens of a request plus the completion reserve"""
+    return sum(estimate_tokens(str(m.get("content") or "")) for m in messages) + LLM_COMPLETION_RESERVE
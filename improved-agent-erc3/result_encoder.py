@@ -0,0 +1,154 @@
+"""
+Compact encoding of tool results before they enter the conversation log
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from pydantic import BaseModel, Field
+
+
+# Cap on one encoded tool result (bytes of UTF-8)
+RESULT_MAX_BYTES = int(os.getenv("RESULT_MAX_BYTES", "12000"))
+# Text fields longer than this are shortened behind an expansion handle
+RESULT_MAX_TEXT = int(os.getenv("RESULT_MAX_TEXT", "500"))
+# Characters returned per expand_result call
+RESULT_EXPAND_CHUNK = int(os.getenv("RESULT_EXPAND_CHUNK", "8000"))
+
+
+class Req_ExpandResult(BaseModel):
+    """Fetch text that was shortened in an earlier tool result (served locally, no API call)"""
+    tool: Literal["expand_result"]
+    handle: str = Field(..., description="handle given in the shortened result, e.g. r3 or r3.employees.0.notes")
+    offset: int = Field(..., description="character offset to continue from (0 for the start)")
+
+
+class Resp_ExpandResult(BaseModel):
+    handle: str
+    text: str
+    next_offset: Optional[int] = None
+
+
+def tabulate(items: List[Any]) -> Optional[Dict[str, Any]]:
+    """{"columns", "rows"} for a list of objects, or None if it isn't one"""
+    if len(items) < 2 or not all(isinstance(item, dict) for item in items):
+        return None
+    columns: List[str] = []
+    for item in items:
+        for key in item:
+            if key not in columns:
+                columns.append(key)
+    return {"columns": columns, "rows": [[item.get(c) for c in columns] for item in items]}
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+class ResultEncoder:
+    """Encodes the tool results of one task
+
+    - lists of objects become {"columns": [...], "rows": [[...], ...]}
+    - strings over `max_text` characters are cut, with a handle for
+      Req_ExpandResult to fetch the rest (unless the caller keeps full text,
+      e.g. for wiki pages the agent asked to read)
+    - a result over `max_bytes` loses rows from its largest list; the full
+      result stays available through its handle
+
+    Safe to use from the tool threads of a step.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_MAX_BYTES, max_text: int = RESULT_MAX_TEXT):
+        self.max_bytes = max_bytes
+        self.max_text = max_text
+        self._lock = threading.Lock()
+        self._texts: Dict[str, str] = {}
+        self._count = 0
+
+    def _register(self, handle: str, text: str):
+        with self._lock:
+            self._texts[handle] = text
+
+    def encode(self, result: BaseModel, full_text: bool = False) -> Tuple[str, int]:
+        """Encoded text of a result and the size of its plain JSON in bytes
+
+        With full_text, strings are not shortened; only the byte cap applies.
+        """
+        raw = result.model_dump_json(exclude_none=True, exclude_unset=True)
+        with self._lock:
+            self._count += 1
+            result_id = f"r{self._count}"
+        max_text = None if full_text else self.max_text
+        data = self._compact(json.loads(raw), [result_id], max_text)
+        text = _dumps(data)
+        if len(text.encode("utf-8")) > self.max_bytes:
+            self._register(result_id, raw)
+            text = self._cap(data, result_id)
+        return text, len(raw.encode("utf-8"))
+
+    def _compact(self, value: Any, path: List[Any], max_text: Optional[int]) -> Any:
+        if isinstance(value, dict):
+            return {k: self._compact(v, path + [k], max_text) for k, v in value.items()}
+        if isinstance(value, list):
+            table = tabulate(value)
+            if table is None:
+                return [self._compact(v, path + [i], max_text) for i, v in enumerate(value)]
+            table["rows"] = [
+                [self._compact(cell, path + [i, column], max_text) for column, cell in zip(table["columns"], row)]
+                for i, row in enumerate(table["rows"])
+            ]
+            return table
+        if isinstance(value, str) and max_text is not None and len(value) > max_text:
+            handle = ".".join(str(p) for p in path)
+            self._register(handle, value)
+            return f"{value[:max_text]}... [+{len(value) - max_text} chars, expand_result handle={handle}]"
+        return value
+
+    def _cap(self, data: Any, result_id: str) -> str:
+        """Drop trailing rows of the largest list until the result fits"""
+        lists: List[List[Any]] = []
+
+        def collect(value: Any):
+            if isinstance(value, dict):
+                if isinstance(value.get("rows"), list) and "columns" in value:
+                    lists.append(value["rows"])
+                for v in value.values():
+                    collect(v)
+            elif isinstance(value, list):
+                lists.append(value)
+                for v in value:
+                    collect(v)
+
+        collect(data)
+        note = {"_truncated": ""}
+        if isinstance(data, dict):
+            data = {**data, **note}
+        if lists:
+            rows = max(lists, key=lambda items: len(_dumps(items)))
+            total = len(rows)
+            size = len(_dumps(data).encode("utf-8"))
+            # Leave room for the note
+            while rows and size > self.max_bytes - 200:
+                size -= len(_dumps(rows.pop()).encode("utf-8")) + 1
+            omitted = total - len(rows)
+            if isinstance(data, dict):
+                data["_truncated"] = (f"{omitted} of {total} items omitted to fit the size cap; "
+                                      f"expand_result handle={result_id} returns the full result")
+        text = _dumps(data)
+        if len(text.encode("utf-8")) > self.max_bytes:
+            text = text[:self.max_bytes - 120] + f"... [cut, expand_result handle={result_id}]"
+        return text
+
+    def expand(self, request: Req_ExpandResult) -> Resp_ExpandResult:
+        """Serve a chunk of text that was shortened earlier"""
+        with self._lock:
+            text = self._texts.get(request.handle)
+        if text is None:
+            raise ValueError(f"unknown expansion handle {request.handle}")
+        start = max(0, request.offset)
+        end = start + RESULT_EXPAND_CHUNK
+        return Resp_ExpandResult(
+            handle=request.handle,
+            text=text[start:end],
+            next_offset=end if end < len(text) else None,
+        )
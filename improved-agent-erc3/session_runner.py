@@ -0,0 +1,146 @@
+"""
+Concurrent task runner for ERC3 sessions
+"""
+import asyncio
+import contextvars
+import io
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+
+class TaskOutputRouter(io.TextIOBase):
+    """stdout replacement that keeps console output of concurrent tasks apart
+
+    Writes made from a thread (or asyncio task) that is inside `capture()` go
+    to its private buffer; everything else goes straight to the wrapped
+    stream. The buffer lives in a context variable, so it follows a task into
+    `asyncio.to_thread` calls.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer: contextvars.ContextVar[Optional[io.StringIO]] = contextvars.ContextVar(
+            "task_output", default=None)
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        buffer = self._buffer.get()
+        if buffer is not None:
+            return buffer.write(text)
+        with self._lock:
+            return self._stream.write(text)
+
+    def flush(self):
+        if self._buffer.get() is None:
+            self._stream.flush()
+
+    def isatty(self) -> bool:
+        return self._stream.isatty()
+
+    def begin_capture(self):
+        """Start buffering output of the current thread or asyncio task"""
+        self._buffer.set(io.StringIO())
+
+    def end_capture(self) -> str:
+        """Stop buffering and return everything the current thread or task printed"""
+        buffer = self._buffer.get()
+        self._buffer.set(None)
+        return buffer.getvalue() if buffer is not None else ""
+
+    def emit(self, text: str):
+        """Write a whole block to the real stream without interleaving"""
+        with self._lock:
+            self._stream.write(text)
+            self._stream.flush()
+
+
+def run_tasks(
+    tasks: Sequence[Any],
+    worker: Callable[[int, Any], Any],
+    max_workers: int = 1,
+) -> List[Optional[Any]]:
+    """
+    Run worker(idx, task) for every task over a bounded thread pool
+
+    Each task's console output is buffered and printed as one block once the
+    task is done, so logs of concurrent tasks never interleave.
+
+    Args:
+        tasks: Tasks in session order
+        worker: Callable receiving the 1-based index and the task
+        max_workers: Maximum number of tasks in flight
+
+    Returns:
+        Worker results in the same order as `tasks` (None if a worker raised)
+    """
+    max_workers = max(1, min(max_workers, len(tasks) or 1))
+    router = sys.stdout if isinstance(sys.stdout, TaskOutputRouter) else TaskOutputRouter(sys.stdout)
+    previous_stdout = sys.stdout
+    sys.stdout = router
+
+    def run_one(idx: int, task: Any) -> Optional[Any]:
+        router.begin_capture()
+        try:
+            return worker(idx, task)
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+            return None
+        finally:
+            router.emit(router.end_capture())
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task") as pool:
+            futures = [pool.submit(run_one, idx, task) for idx, task in enumerate(tasks, 1)]
+            # the pool is drained before leaving the block, so every worker is done here
+            return [future.result() for future in futures]
+    finally:
+        sys.stdout = previous_stdout
+
+
+def run_tasks_async(
+    tasks: Sequence[Any],
+    worker: Callable[[int, Any], Awaitable[Any]],
+    max_concurrency: int = 1,
+) -> List[Optional[Any]]:
+    """
+    Run the coroutine worker(idx, task) for every task on one event loop
+
+    Same contract as run_tasks, but tasks in flight share a single thread
+    while they wait on the LLM.
+
+    Args:
+        tasks: Tasks in session order
+        worker: Async callable receiving the 1-based index and the task
+        max_concurrency: Maximum number of tasks in flight
+
+    Returns:
+        Worker results in the same order as `tasks` (None if a worker raised)
+    """
+    router = sys.stdout if isinstance(sys.stdout, TaskOutputRouter) else TaskOutputRouter(sys.stdout)
+    previous_stdout = sys.stdout
+    sys.stdout = router
+
+    async def run_all() -> List[Optional[Any]]:
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run_one(idx: int, task: Any) -> Optional[Any]:
+            # Each asyncio task runs in its own context, so captures don't mix
+            async with semaphore:
+                router.begin_capture()
+                try:
+                    return await worker(idx, task)
+                except Exception:
+                    traceback.print_exc(file=sys.stdout)
+                    return None
+                finally:
+                    router.emit(router.end_capture())
+
+        return await asyncio.gather(*(run_one(idx, task) for idx, task in enumerate(tasks, 1)))
+
+    try:
+        return asyncio.run(run_all())
+    finally:
+        sys.stdout = previous_stdout
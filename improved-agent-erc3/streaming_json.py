@@ -0,0 +1,65 @@
+"""
+Incremental parser for streamed JSON objects (structured output)
+"""
+import json
+from typing import Any, List, Tuple
+
+
+class StreamingObjectParser:
+    """Yields top-level fields of a JSON object as soon as each one is complete
+
+    Structured output is generated field by field in schema order, so e.g.
+    `function` is fully known while later fields are still being generated.
+    Text is fed in arbitrary chunks; a field counts as complete once the
+    comma or closing brace after its value arrives.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = -1
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add streamed text; returns the (name, value) fields completed by it"""
+        self.text += chunk
+        fields: List[Tuple[str, Any]] = []
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = self._pos + 1
+            elif ch in "}]":
+                if self._depth == 1:
+                    fields.extend(self._member(self._pos))
+                    self.done = True
+                self._depth -= 1
+            elif ch == "," and self._depth == 1:
+                fields.extend(self._member(self._pos))
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return fields
+
+    def _member(self, end: int) -> List[Tuple[str, Any]]:
+        member = self.text[self._member_start:end].strip()
+        if not member:
+            return []
+        try:
+            return list(json.loads("{" + member + "}").items())
+        except ValueError:
+            # Not plain JSON (e.g. a fenced answer); the final parse reports it
+            return []
@@ -0,0 +1,8 @@
+"""
+Cheap token estimates for prompt budgeting
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English/JSON)"""
+    return (len(text) + 3) // 4
@@ -0,0 +1,167 @@
+"""
+Local BM25 retrieval over wiki sections
+"""
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Literal, Tuple
+from pydantic import BaseModel, Field
+from tokens import estimate_tokens
+
+
+class WikiChunk(BaseModel):
+    """One section of a wiki page"""
+    path: str
+    heading: str
+    content: str
+
+
+class WikiSearchHit(BaseModel):
+    path: str
+    heading: str
+    score: float
+    content: str
+
+
+class Req_SearchWikiLocal(BaseModel):
+    """Search the already loaded wiki (served locally, no API call)"""
+    tool: Literal["search_wiki_local"]
+    query: str = Field(..., description="keywords to look for in the company wiki")
+    limit: int = Field(..., description="maximum number of sections to return (e.g. 5)")
+
+
+class Resp_SearchWikiLocal(BaseModel):
+    results: List[WikiSearchHit]
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.*)$")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def is_rulebook(path: str) -> bool:
+    return "rule" in path.lower()
+
+
+def chunk_page(path: str, content: str, max_tokens: int = 400) -> List[WikiChunk]:
+    """Split a markdown page into heading sections of at most ~max_tokens each"""
+    sections: List[Tuple[str, List[str]]] = [("", [])]
+    for line in content.splitlines():
+        match = _HEADING_RE.match(line)
+        if match:
+            sections.append((match.group(1).strip(), [line]))
+        else:
+            sections[-1][1].append(line)
+
+    chunks = []
+    for heading, lines in sections:
+        text = "\n".join(lines).strip()
+        if not text:
+            continue
+        # Long sections are split further on paragraph boundaries
+        part: List[str] = []
+        for paragraph in text.split("\n\n"):
+            if part and estimate_tokens("\n\n".join(part + [paragraph])) > max_tokens:
+                chunks.append(WikiChunk(path=path, heading=heading, content="\n\n".join(part)))
+                part = []
+            part.append(paragraph)
+        if part:
+            chunks.append(WikiChunk(path=path, heading=heading, content="\n\n".join(part)))
+    return chunks
+
+
+class WikiIndex:
+    """BM25 index over chunked wiki pages, built once per wiki version"""
+
+    def __init__(self, pages: Dict[str, str], k1: float = 1.5, b: float = 0.75):
+        self.pages = pages
+        self.k1 = k1
+        self.b = b
+        self.chunks: List[WikiChunk] = []
+        for path, content in pages.items():
+            self.chunks.extend(chunk_page(path, content))
+
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for idx, chunk in enumerate(self.chunks):
+            terms = Counter(tokenize(f"{chunk.path} {chunk.heading} {chunk.content}"))
+            self._lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self._postings.setdefault(term, []).append((idx, tf))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        self._rulebook = {idx for idx, chunk in enumerate(self.chunks) if is_rulebook(chunk.path)}
+
+    def search(self, query: str, limit: int = 5, skip_rulebook: bool = False) -> List[Tuple[float, WikiChunk]]:
+        """Return up to `limit` (score, chunk) pairs, best first
+
+        With skip_rulebook, rulebook chunks are left out before the cut, so
+        `limit` other chunks are returned when there are that many matches.
+        """
+        n = len(self.chunks)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for idx, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[idx] / self._avg_length)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        if skip_rulebook:
+            scores = {idx: score for idx, score in scores.items() if idx not in self._rulebook}
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(score, self.chunks[idx]) for idx, score in best]
+
+    def lookup(self, request: Req_SearchWikiLocal) -> Resp_SearchWikiLocal:
+        """Serve a local wiki search tool call"""
+        hits = self.search(request.query, max(1, min(request.limit, 20)))
+        return Resp_SearchWikiLocal(results=[
+            WikiSearchHit(path=c.path, heading=c.heading, score=round(s, 3), content=c.content)
+            for s, c in hits
+        ])
+
+    def rulebook_context(self) -> str:
+        """Render all rulebook pages in full (identical for every task)"""
+        return "".join(
+            f"\n## {path}\n{content}\n"
+            for path, content in self.pages.items() if is_rulebook(path)
+        )
+
+    def relevant_context(self, query: str, token_budget: int = 6000, top_k: int = 8) -> str:
+        """Render the top_k non-rulebook sections most relevant to `query` within token_budget"""
+        parts = []
+        used = 0
+        for _, chunk in self.search(query, top_k, skip_rulebook=True):
+            title = f"{chunk.path} > {chunk.heading}" if chunk.heading else chunk.path
+            text = f"\n## {title}\n{chunk.content}\n"
+            cost = estimate_tokens(text)
+            if used + cost > token_budget:
+                continue
+            parts.append(text)
+            used += cost
+        return "".join(parts)
+
+
+# Indexes are rebuilt only when the wiki changes. Strings cache their hash, so
+# fingerprinting the (shared) page dict from WikiStore is cheap after the first task.
+_indexes: "OrderedDict[int, WikiIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_wiki_index(pages: Dict[str, str]) -> WikiIndex:
+    """Return a (memoized) index for the given pages"""
+    fingerprint = hash(tuple(sorted(pages.items())))
+    with _indexes_lock:
+        index = _indexes.get(fingerprint)
+        if index is None:
+            index = WikiIndex(pages)
+            _indexes[fingerprint] = index
+            while len(_indexes) > 4:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(fingerprint)
+        return index
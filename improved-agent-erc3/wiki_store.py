@@ -0,0 +1,168 @@
+"""
+Session-wide wiki cache shared by all tasks of a session
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+
+def content_hash(content: str) -> str:
+    """Stable hash of a page body"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class WikiStore:
+    """In-memory (and optionally on-disk) cache of wiki pages
+
+    The wiki is identical for every task of a session, so pages are fetched
+    once, concurrently, and reused until the page list changes. When a cache
+    directory is configured, page bodies are stored by path + content hash so
+    later processes can skip the download entirely.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: int = 8):
+        """
+        Args:
+            cache_dir: Directory for the on-disk cache (None = memory only)
+            max_workers: Number of pages fetched in parallel
+        """
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._key: Optional[str] = None
+        self._pages: Dict[str, str] = {}
+        self._hashes: Dict[str, str] = {}
+        self.fetches = 0
+        self.reuses = 0
+
+    def get_pages(
+        self,
+        store_api,
+        version: Optional[str] = None,
+        log: Callable[[str], None] = print,
+    ) -> Dict[str, str]:
+        """
+        Return {path: content} for the wiki visible through store_api
+
+        Only the page list is requested when the cache is warm. Pages are
+        (re)loaded when the list (or the wiki version, if known) differs from
+        the cached one.
+
+        Args:
+            store_api: ERC3 dev client of the current task
+            version: Wiki version reported by the API, e.g. who_am_i().wiki_sha1
+            log: Callback for progress messages
+        """
+        paths = list(store_api.list_wiki_pages().paths)
+        key = self._index_key(paths, version)
+
+        # Concurrent tasks wait here for the first one to fill the cache
+        with self._lock:
+            if key == self._key:
+                self.reuses += 1
+                return dict(self._pages)
+
+            pages = self._load_from_disk(key)
+            missing = [p for p in paths if p not in pages]
+            if missing:
+                log(f"Loading {len(missing)} wiki pages...")
+                pages.update(self._fetch(store_api, missing, log))
+                self.fetches += 1
+
+            self._pages = {p: pages[p] for p in paths if p in pages}
+            self._hashes = {p: content_hash(c) for p, c in self._pages.items()}
+            # Pages that failed to load are retried by the next task
+            self._key = key if len(self._pages) == len(paths) else None
+            self._save_to_disk()
+            return dict(self._pages)
+
+    def invalidate(self, path: Optional[str] = None):
+        """Drop one page (or everything) so it is fetched again on next use"""
+        with self._lock:
+            self._key = None
+            if path is None:
+                self._pages.clear()
+                self._hashes.clear()
+            else:
+                self._pages.pop(path, None)
+                self._hashes.pop(path, None)
+
+    def _fetch(self, store_api, paths: List[str], log: Callable[[str], None]) -> Dict[str, str]:
+        """Load pages concurrently, skipping the ones that fail"""
+        def load(path: str):
+            try:
+                return path, store_api.load_wiki_page(path).content, None
+            except Exception as e:
+                return path, None, e
+
+        workers = max(1, min(self.max_workers, len(paths)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wiki") as pool:
+            results = list(pool.map(load, paths))
+        # Logged from the calling thread so per-task console capture sees it
+        for path, _, error in results:
+            if error is not None:
+                log(f"Could not load {path}: {error}")
+        return {path: content for path, content, _ in results if content is not None}
+
+    # On-disk layout: index.json maps "path list + version hash" -> {path: content hash},
+    # page bodies live in pages/<content hash>.md
+
+    def _index_key(self, paths: List[str], version: Optional[str]) -> str:
+        raw = "\n".join([version or ""] + paths)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load_from_disk(self, key: str) -> Dict[str, str]:
+        if not self.cache_dir:
+            return {}
+        hashes = self._read_index().get(key, {})
+        pages = {}
+        for path, digest in hashes.items():
+            blob = os.path.join(self.cache_dir, "pages", f"{digest}.md")
+            try:
+                with open(blob, encoding="utf-8") as f:
+                    content = f.read()
+            except OSError:
+                continue
+            if content_hash(content) == digest:
+                pages[path] = content
+        return pages
+
+    def _save_to_disk(self):
+        if not self.cache_dir or self._key is None:
+            return
+        os.makedirs(os.path.join(self.cache_dir, "pages"), exist_ok=True)
+        for path, content in self._pages.items():
+            blob = os.path.join(self.cache_dir, "pages", f"{self._hashes[path]}.md")
+            if not os.path.exists(blob):
+                with open(blob, "w", encoding="utf-8") as f:
+                    f.write(content)
+        index = self._read_index()
+        index[self._key] = dict(self._hashes)
+        tmp = os.path.join(self.cache_dir, "index.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp, os.path.join(self.cache_dir, "index.json"))
+
+    def _read_index(self) -> Dict[str, Dict[str, str]]:
+        try:
+            with open(os.path.join(self.cache_dir, "index.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+# One store per process: all tasks of a session share it
+_default_store: Optional[WikiStore] = None
+_default_lock = threading.Lock()
+
+
+def get_wiki_store() -> WikiStore:
+    """Return the process-wide wiki store (configured via WIKI_CACHE_DIR)"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = WikiStore(cache_dir=os.getenv("WIKI_CACHE_DIR") or None)
+        return _default_store
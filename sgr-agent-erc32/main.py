@@ -1,9 +1,7 @@
 import textwrap
-from openai import OpenAI
 from store_agent import run_agent
 from erc3 import ERC3
 
-client = OpenAI()
 core = ERC3()
 MODEL_ID = "gpt-4o"
 
@@ -3,9 +3,16 @@ from typing import Annotated, List, Union, Literal
 from annotated_types import MaxLen, MinLen
 from pydantic import BaseModel, Field
 from erc3 import erc3 as dev, ApiException, TaskInfo, ERC3
-from openai import OpenAI
 
-client = OpenAI()
+_client = None
+
+def get_client():
+    # created on first use: importing this module stays cheap and needs no API key
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI()
+    return _client
 
 class NextStep(BaseModel):
     current_state: str
@@ -78,7 +85,7 @@ When task is done or can't be done - Req_ProvideAgentResponse.
 
         started = time.time()
 
-        completion = client.beta.chat.completions.parse(
+        completion = get_client().beta.chat.completions.parse(
             model=model,
             response_format=NextStep,
             messages=log,
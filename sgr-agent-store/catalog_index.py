@@ -0,0 +1,173 @@
+"""
+In-memory product catalog for the store agent, searched locally
+"""
+import difflib
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+# "task" loads the catalog for every task, "session" once per process
+STORE_CATALOG_SCOPE = os.getenv("STORE_CATALOG_SCOPE", "task")
+STORE_CATALOG_MAX_ITEMS = int(os.getenv("STORE_CATALOG_MAX_ITEMS", "50000"))
+# Results per search are capped at this
+SEARCH_MAX_RESULTS = 50
+
+
+class Req_SearchCatalog(BaseModel):
+    """Search the whole product catalog (served locally, no API call)"""
+    tool: Literal["search_catalog"]
+    sku: Optional[str] = Field(..., description="exact SKU, or null")
+    name: Optional[str] = Field(..., description="words from the product name (typos are tolerated), or null")
+    min_price: Optional[float] = Field(..., description="lowest price, or null")
+    max_price: Optional[float] = Field(..., description="highest price, or null")
+    in_stock_only: bool = Field(..., description="only products with available > 0 (stock as of loading)")
+    limit: int = Field(..., description="maximum number of products to return (e.g. 10)")
+
+
+class Resp_SearchCatalog(BaseModel):
+    products: List[Dict[str, Any]]
+    matched: int
+    catalog_size: int
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _field(product: Any, name: str, default: Any = None) -> Any:
+    if isinstance(product, dict):
+        return product.get(name, default)
+    return getattr(product, name, default)
+
+
+class CatalogIndex:
+    """Column-oriented product store with SKU, fuzzy name and price lookups
+
+    Each attribute is kept as one column (arrays for numbers) and products
+    are addressed by row number, so tens of thousands of items stay small:
+    - SKU -> row dict for exact lookups
+    - name token -> rows, with prefix and close-spelling matches over the vocabulary
+    - rows sorted by price with a parallel price column for range bisects
+    """
+
+    def __init__(self, products: List[Any]):
+        self.skus: List[str] = []
+        self.names: List[str] = []
+        self.prices = array("d")
+        self.available = array("l")
+        self._rows: Dict[str, int] = {}
+        postings: Dict[str, List[int]] = {}
+        for product in products:
+            sku = str(_field(product, "sku", ""))
+            if not sku or sku.upper() in self._rows:
+                continue
+            row = len(self.skus)
+            self._rows[sku.upper()] = row
+            self.skus.append(sku)
+            self.names.append(str(_field(product, "name", "") or ""))
+            self.prices.append(float(_field(product, "price", 0.0) or 0.0))
+            self.available.append(int(_field(product, "available", 0) or 0))
+            for token in set(tokenize(self.names[-1])):
+                postings.setdefault(token, []).append(row)
+
+        self._tokens = {token: array("l", rows) for token, rows in postings.items()}
+        self._vocabulary = sorted(self._tokens)
+        # candidates for spelling matches: words by first letter, numbers left out
+        self._by_initial: Dict[str, List[str]] = {}
+        for word in self._vocabulary:
+            if not word.isdigit():
+                self._by_initial.setdefault(word[0], []).append(word)
+        self._by_price = array("l", sorted(range(len(self.skus)), key=self.prices.__getitem__))
+        self._sorted_prices = array("d", (self.prices[row] for row in self._by_price))
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+    def product(self, row: int) -> Dict[str, Any]:
+        return {
+            "sku": self.skus[row],
+            "name": self.names[row],
+            "price": self.prices[row],
+            "available": self.available[row],
+        }
+
+    def _token_rows(self, token: str) -> List[int]:
+        """Rows whose name has the token, a token it prefixes, or a close spelling"""
+        matches = {token} if token in self._tokens else set()
+        start = bisect_left(self._vocabulary, token)
+        for word in self._vocabulary[start:start + 20]:
+            if not word.startswith(token):
+                break
+            matches.add(word)
+        if not matches and not token.isdigit():
+            candidates = self._by_initial.get(token[0], [])
+            matches.update(difflib.get_close_matches(token, candidates, n=3, cutoff=0.75))
+        rows = set()
+        for word in matches:
+            rows.update(self._tokens[word])
+        return list(rows)
+
+    def _price_rows(self, min_price: Optional[float], max_price: Optional[float]) -> array:
+        lo = bisect_left(self._sorted_prices, min_price) if min_price is not None else 0
+        hi = bisect_right(self._sorted_prices, max_price) if max_price is not None else len(self._by_price)
+        return self._by_price[lo:hi]
+
+    def search(self, request: Req_SearchCatalog) -> Resp_SearchCatalog:
+        # name score per row; None = no name filter
+        scores: Optional[Dict[int, int]] = None
+        if request.sku:
+            row = self._rows.get(request.sku.strip().upper())
+            scores = {row: 0} if row is not None else {}
+        elif request.name and tokenize(request.name):
+            scores = {}
+            for token in tokenize(request.name):
+                for row in self._token_rows(token):
+                    scores[row] = scores.get(row, 0) + 1
+
+        def in_range(row: int) -> bool:
+            price = self.prices[row]
+            return ((request.min_price is None or price >= request.min_price)
+                    and (request.max_price is None or price <= request.max_price))
+
+        if scores is None:
+            rows = list(self._price_rows(request.min_price, request.max_price))
+        else:
+            # best name matches first, cheaper first among equals
+            rows = sorted((row for row in scores if in_range(row)), key=lambda r: (-scores[r], self.prices[r]))
+        if request.in_stock_only:
+            rows = [row for row in rows if self.available[row] > 0]
+
+        limit = max(1, min(request.limit, SEARCH_MAX_RESULTS))
+        return Resp_SearchCatalog(
+            products=[self.product(row) for row in rows[:limit]],
+            matched=len(rows),
+            catalog_size=len(self),
+        )
+
+
+_shared: Optional[CatalogIndex] = None
+_shared_lock = threading.Lock()
+
+
+def get_catalog(load: Callable[[], List[Any]]) -> CatalogIndex:
+    """
+    Catalog index for a task, built from load() (all products)
+
+    With STORE_CATALOG_SCOPE=session the first index is reused by every
+    later task of the process; use it only when tasks share one catalog.
+    """
+    global _shared
+    if STORE_CATALOG_SCOPE != "session":
+        return CatalogIndex(load())
+    with _shared_lock:
+        if _shared is None:
+            _shared = CatalogIndex(load())
+        return _shared
@@ -1,27 +1,59 @@
+import os
 import time
-from typing import Annotated, List, Union, Literal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, List, Optional, Union, Literal
 from annotated_types import MaxLen, MinLen
 from pydantic import BaseModel, Field
 from erc3 import store, ApiException, TaskInfo, ERC3
-from openai import OpenAI
+from catalog_index import Req_SearchCatalog, STORE_CATALOG_MAX_ITEMS, get_catalog
 
-client = OpenAI()
+# same variable and default as the enhanced agent's pagination draining
+PAGINATION_MAX_ITEMS = int(os.getenv("PAGINATION_MAX_ITEMS", "500"))
+
+_client = None
+
+def get_client():
+    # created on first use: importing this module stays cheap and needs no API key
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI()
+    return _client
 
 class ReportTaskCompletion(BaseModel):
     tool: Literal["report_completion"]
     completed_steps_laconic: List[str]
     code: Literal["completed", "failed"]
 
+class Req_FindBestCoupon(BaseModel):
+    tool: Literal["find_best_coupon"]
+    coupons: Annotated[List[str], MinLen(1), MaxLen(20)] = Field(..., description="coupon codes to compare on the current basket")
+
+class CouponTrial(BaseModel):
+    coupon: str
+    total: Optional[float] = None
+    discount: Optional[float] = None
+    error: Optional[str] = None
+
+class Resp_FindBestCoupon(BaseModel):
+    best_coupon: Optional[str]
+    total_without_coupon: float
+    best_total: float
+    trials: List[CouponTrial]
+
 class NextStep(BaseModel):
     current_state: str
     # we'll use only the first step, discarding all the rest.
     plan_remaining_steps_brief: Annotated[List[str], MinLen(1), MaxLen(5)] =  Field(..., description="explain your thoughts on how to accomplish - what steps to execute")
     # now let's continue the cascade and check with LLM if the task is done
     task_completed: bool
+    fetch_all_pages: bool = Field(..., description="for ListProducts: return all pages at once instead of one page")
     # Routing to one of the tools to execute the first remaining step
     # if task is completed, model will pick ReportTaskCompletion
     function: Union[
         ReportTaskCompletion,
+        Req_FindBestCoupon,
+        Req_SearchCatalog,
         store.Req_ListProducts,
         store.Req_ViewBasket,
         store.Req_ApplyCoupon,
@@ -31,22 +63,85 @@ class NextStep(BaseModel):
         store.Req_CheckoutBasket,
     ] = Field(..., description="execute first remaining step")
 
-system_prompt = """
+system_prompt = f"""
 You are a business assistant helping customers of OnlineStore.
 
 - Clearly report when tasks are done.
-- If ListProducts returns non-zero "NextOffset", it means there are more products available.
+- Prefer SearchCatalog to find products by SKU, name or price range: it searches the whole catalog locally.
+- Set fetch_all_pages=true on ListProducts when you need every product: all pages (up to {PAGINATION_MAX_ITEMS} products) come back in one result, and a non-zero "NextOffset" then only means the list was capped.
 - You can apply coupon codes to get discounts. Use ViewBasket to see current discount and total.
 - Only one coupon can be applied at a time. Apply a new coupon to replace the current one, or remove it explicitly.
+- To pick between several coupons use FindBestCoupon: it tries them all on the current basket and leaves the best one applied. Add the products first.
 """
 
 CLI_RED = "\x1B[31m"
 CLI_GREEN = "\x1B[32m"
 CLI_CLR = "\x1B[0m"
 
+def drain_product_pages(store_api, req: store.Req_ListProducts, max_items: int = PAGINATION_MAX_ITEMS, workers: int = 4):
+    # every page of ListProducts merged into one response, at most max_items products;
+    # next_offset then points past the last one. The store's only paged endpoint, so
+    # this skips the generic item-field lookup of the enhanced agent's drain_pages.
+    first = store_api.dispatch(req)
+    products, next_offset = list(first.products), first.next_offset
+    page_size = len(products)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="page") as pool:
+        while page_size and (next_offset or 0) > 0 and len(products) < max_items:
+            # after the first page the size is known, so request the next batch at once
+            batch = [req.model_copy(update={"offset": next_offset + k * page_size}) for k in range(workers)]
+            for page in pool.map(store_api.dispatch, batch):
+                products.extend(page.products)
+                next_offset = page.next_offset
+                if not page.products or (next_offset or 0) <= 0:
+                    break  # the rest of the batch is past the end
+    if len(products) > max_items:
+        products, next_offset = products[:max_items], (req.offset or 0) + max_items
+    return first.model_copy(update={"products": products, "next_offset": next_offset})
+
+def find_best_coupon(store_api, req: Req_FindBestCoupon) -> Resp_FindBestCoupon:
+    # try every coupon against the basket in one tool call instead of an
+    # apply/view round trip through the LLM per coupon
+    basket = store_api.dispatch(store.Req_ViewBasket())
+    codes = list(dict.fromkeys(req.coupons))
+    if basket.coupon and basket.coupon not in codes:
+        codes.append(basket.coupon)
+
+    if basket.coupon:
+        store_api.dispatch(store.Req_RemoveCoupon())
+        basket = store_api.dispatch(store.Req_ViewBasket())
+    trials = []
+    for code in codes:
+        try:
+            store_api.dispatch(store.Req_ApplyCoupon(coupon=code))
+            view = store_api.dispatch(store.Req_ViewBasket())
+            trials.append(CouponTrial(coupon=code, total=view.total, discount=view.discount))
+        except ApiException as e:
+            trials.append(CouponTrial(coupon=code, error=e.detail or e.api_error.error))
+
+    # the first listed coupon wins ties; a coupon that saves nothing is not kept
+    valid = [t for t in trials if t.total is not None and t.total < basket.total]
+    best = min(valid, key=lambda t: t.total) if valid else None
+    # a failed apply may or may not have cleared the previous coupon, so the
+    # final state is set explicitly and read back rather than inferred
+    if best is not None:
+        store_api.dispatch(store.Req_ApplyCoupon(coupon=best.coupon))
+    final = store_api.dispatch(store.Req_ViewBasket())
+    if best is None and final.coupon:
+        store_api.dispatch(store.Req_RemoveCoupon())
+        final = store_api.dispatch(store.Req_ViewBasket())
+
+    return Resp_FindBestCoupon(
+        best_coupon=final.coupon or None,
+        total_without_coupon=basket.total,
+        best_total=final.total,
+        trials=trials,
+    )
+
 def run_agent(model: str, api: ERC3, task: TaskInfo):
 
     store_api = api.get_store_client(task)
+    # loaded on the first SearchCatalog
+    catalog = None
 
     # log will contain conversation context for the agent within task
     log = [
@@ -61,7 +156,7 @@ def run_agent(model: str, api: ERC3, task: TaskInfo):
 
         started = time.time()
 
-        completion = client.beta.chat.completions.parse(
+        completion = get_client().beta.chat.completions.parse(
             model=model,
             response_format=NextStep,
             messages=log,
@@ -103,7 +198,18 @@ def run_agent(model: str, api: ERC3, task: TaskInfo):
 
         # now execute the tool by dispatching command to our handler
         try:
-            result = store_api.dispatch(job.function)
+            if isinstance(job.function, store.Req_ListProducts) and job.fetch_all_pages:
+                result = drain_product_pages(store_api, job.function)
+            elif isinstance(job.function, Req_SearchCatalog):
+                if catalog is None:
+                    catalog = get_catalog(lambda: drain_product_pages(
+                        store_api, store.Req_ListProducts(offset=0, limit=100),
+                        max_items=STORE_CATALOG_MAX_ITEMS, workers=8).products)
+                result = catalog.search(job.function)
+            elif isinstance(job.function, Req_FindBestCoupon):
+                result = find_best_coupon(store_api, job.function)
+            else:
+                result = store_api.dispatch(job.function)
             txt = result.model_dump_json(exclude_none=True, exclude_unset=True)
             print(f"{CLI_GREEN}OUT{CLI_CLR}: {txt}")
         except ApiException as e: